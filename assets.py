@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import os
+import re
+
+
+# quoted strings (kept as is) and comments (removed)
+CSS_TOKENS_RE = re.compile(
+    br'''("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|/\*.*?\*/''', re.S)
+CSS_SPACES_RE = re.compile(br'\s+')
+CSS_PUNCTUATION_RE = re.compile(br'\s*([{};,>])\s*')
+CSS_URL_RE = re.compile(br'''(url\(\s*|@import\s*(?=["']))'''
+    br'''(?:"([^"]*)"|'([^']*)'|([^"')\s;]+))''', re.I)
+# at-rules which must precede all the other rules of a stylesheet
+CSS_HEADER_RE = re.compile(br'\s*(?:(/\*.*?\*/)|@(charset|import)\b'
+    br'''((?:[^;"']|"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')*);)''', re.S | re.I)
+# scheme, protocol-relative, absolute, fragment or data url
+CSS_ABSOLUTE_URL_RE = re.compile(br'^(?:[a-z][a-z0-9+.-]*:|/|#)', re.I)
+
+
+def minify_css(source):
+    ''' Strips comments and whitespace, quoted strings are kept as is '''
+
+    chunks = []
+    code = []
+    position = 0
+    for match in CSS_TOKENS_RE.finditer(source):
+        code.append(source[position:match.start()])
+        position = match.end()
+        if match.group(1) is not None:
+            chunks.append(minify_css_code(b''.join(code)))
+            chunks.append(match.group(1))
+            code = []
+    code.append(source[position:])
+    chunks.append(minify_css_code(b''.join(code)))
+    return b''.join(chunks).strip()
+
+
+def minify_css_code(source):
+    source = CSS_SPACES_RE.sub(b' ', source)
+    source = CSS_PUNCTUATION_RE.sub(br'\1', source)
+    return source.replace(b';}', b'}')
+
+
+def rebase_css_urls(source, source_dir, target_dir):
+    '''
+    Rewrites relative urls of "url()" and "@import" which are resolved
+    against source_dir, so they are resolved against target_dir the same way
+    '''
+
+    def rebase(match):
+        quoted = match.group(2) is not None or match.group(3) is not None
+        url = next(g for g in match.groups()[1:] if g is not None)
+        if not url or CSS_ABSOLUTE_URL_RE.match(url):
+            return match.group(0)
+        path, query = re.match(br'([^?#]*)(.*)', url, re.S).groups()
+        path = os.path.relpath(os.path.join(source_dir, os.fsdecode(path)),
+            target_dir).replace(os.sep, '/')
+        url = os.fsencode(path) + query
+        return match.group(1) + (b'"' + url + b'"' if quoted else url)
+
+    return CSS_URL_RE.sub(rebase, source)
+
+
+def split_css_header(source):
+    '''
+    Returns "@charset" value, list of "@import" rules and the rest of the
+    stylesheet. Comments preceding the rules are kept in the rest.
+    '''
+
+    charset = None
+    imports = []
+    comments = []
+    position = 0
+    while True:
+        match = CSS_HEADER_RE.match(source, position)
+        if match is None:
+            break
+        position = match.end()
+        if match.group(1) is not None:
+            comments.append(match.group(1))
+        elif match.group(2).lower() == b'charset':
+            charset = charset or match.group(3).strip()
+        else:
+            imports.append(b'@import ' + match.group(3).strip() + b';')
+    return charset, imports, b'\n'.join(comments + [source[position:]])
+
+
+def join_css(sources):
+    '''
+    Concatenates stylesheets: "@charset" (the first one) and "@import"
+    rules of all the sources are hoisted to the top, where they are allowed
+    '''
+
+    charset = None
+    imports = []
+    rest = []
+    for source in sources:
+        source_charset, source_imports, source = split_css_header(source)
+        charset = charset or source_charset
+        imports.extend(source_imports)
+        rest.append(source)
+    if imports:
+        logging.warning('@import rules are hoisted to the top of bundle, '
+            'imported styles now precede all the bundled ones')
+    header = ([b'@charset ' + charset + b';'] if charset else []) + imports
+    return b'\n'.join(header + rest)
+
+
+def minify_js(source):
+    '''
+    Conservative minification which keeps line breaks (so automatic
+    semicolon insertion is not affected): strips indentation, empty lines and
+    comments occupying whole lines. Sources with template literals are kept
+    as is, whitespace inside them matters, and so are lines following a
+    trailing backslash (continued string).
+    '''
+
+    if b'`' in source:
+        return source
+
+    lines = []
+    in_comment = False
+    continued = False
+    for line in source.splitlines():
+        if continued:
+            continued = line.endswith(b'\\')
+            lines.append(line)
+            continue
+        continued = line.endswith(b'\\')
+        line = line.strip()
+        if in_comment:
+            if not b'*/' in line:
+                continue
+            in_comment = False
+            line = line[line.index(b'*/') + 2:].strip()
+        elif line.startswith(b'/*') and not line.startswith(b'/*!'):
+            end = line.find(b'*/', 2)
+            if end == -1:
+                in_comment = True
+                continue
+            if end == len(line) - 2:
+                continue
+        if not line or line.startswith(b'//'):
+            continue
+        lines.append(line)
+    return b'\n'.join(lines)
+
+
+minifiers = {
+    'css': minify_css,
+    'js': minify_js
+}
+
+
+class AssetBuilder(object):
+    '''
+    Builds static assets: minified copy of each lib and one bundle of each
+    package chain, all with content-hashed filenames, so they may be cached
+    by browsers forever. Paths are written to the manifest which is loaded by
+    StaticManager when compressed static is used.
+    '''
+
+    manifest_name = 'manifest.json'
+
+    def __init__(self, static_manager, directory='bundles'):
+        self.static_manager = static_manager
+        self.directory = directory
+        self.path = os.path.join(static_manager.static_path, directory)
+        self.sources = {}
+
+    def build(self):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        manifest = {'libs': {}, 'bundles': {}}
+        for ext, libs in self.static_manager.libs.items():
+            manifest['libs'][ext] = {}
+            for name, lib in libs.items():
+                source = self.read(lib)
+                if source is not None:
+                    manifest['libs'][ext][name] = self.write(name, ext, source)
+
+            # package chains become bundles, common chain is stored by ""
+            manifest['bundles'][ext] = {}
+            join = join_css if ext == 'css' else b';\n'.join
+            for (chain_ext, package), chain in \
+                self.static_manager.chains.items():
+                    sources = [self.read(lib) for lib in chain]
+                    sources = [s for s in sources if s is not None]
+                    if chain_ext != ext or not sources:
+                        continue
+                    manifest['bundles'][ext][package or ''] = self.write(
+                        package or 'common', ext, join(sources))
+
+        # files of the previous build are kept for pages which are rendered
+        # by processes not restarted yet
+        previous = load_manifest(self.static_manager.static_path,
+            self.directory)
+        with open(os.path.join(self.path, self.manifest_name), 'w') as f:
+            json.dump(manifest, f, indent=4, sort_keys=True)
+        self.remove_stale(manifest, previous)
+        logging.info('Static assets are built to "{0}"'.format(self.path))
+        return manifest
+
+    def read(self, lib):
+        ''' Returns minified source of the lib or None if it is missing '''
+
+        key = (lib.ext, lib.full_name)
+        if not key in self.sources:
+            self.sources[key] = None
+            # hand-made minified version is preferred
+            for minified, path in ((True, lib.get_minified_path()),
+                    (False, lib.get_source_path())):
+                if os.path.isfile(path):
+                    with open(path, 'rb') as f:
+                        source = f.read()
+                    if not minified and lib.ext in minifiers:
+                        source = minifiers[lib.ext](source)
+                    if lib.ext == 'css':
+                        source = rebase_css_urls(source,
+                            os.path.dirname(path), self.path)
+                    self.sources[key] = source
+                    break
+            else:
+                logging.warning('Static lib "{0}" is not found'.format(lib))
+        return self.sources[key]
+
+    def write(self, name, ext, data):
+        ''' Writes data to content-hashed file. Returns its static path '''
+
+        filename = '{0}-{1}.{2}'.format(name.replace('/', '.'),
+            hashlib.sha1(data).hexdigest()[:16], ext)
+        path = os.path.join(self.path, filename)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+        return '/'.join([self.directory, filename])
+
+    def remove_stale(self, manifest, previous=None):
+        ''' Removes files of neither the manifest nor the previous one '''
+
+        used = set([self.manifest_name])
+        for generation in (manifest, previous or {}):
+            for section in generation.values():
+                for paths in section.values():
+                    used.update(p.split('/')[-1] for p in paths.values())
+        for filename in os.listdir(self.path):
+            if not filename in used:
+                os.unlink(os.path.join(self.path, filename))
+
+
+def load_manifest(static_path, directory='bundles'):
+    path = os.path.join(static_path, directory, AssetBuilder.manifest_name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
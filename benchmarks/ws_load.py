@@ -0,0 +1,280 @@
+'''
+End-to-end websocket load test. Starts Application with the demo chat
+package in a separate process (messages are stored by in-memory stand-in
+database, so MongoDB is not needed), opens N websocket clients and sends
+"chat/new_message" events at the target rate. Every message is broadcast to
+all the clients, so each of them measures broadcast latency.
+
+Results (throughput, p50/p99 latency, memory per connection and CPU usage
+of the server process) are written as JSON:
+
+    python -m meteor.benchmarks.ws_load --clients 100 --rate 200 \
+        --duration 10 --output results.json
+'''
+
+import argparse
+import configparser
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import tornado.gen
+import tornado.httpclient
+import tornado.ioloop
+import tornado.web
+import tornado.websocket
+from tornado.concurrent import Future
+
+
+DEMO_PATH = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'demo')
+
+
+class StandInQuery(object):
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, *fields):
+        for field in reversed(fields):
+            self.documents = sorted(self.documents,
+                key=lambda d: getattr(d, field.lstrip('-')),
+                reverse=field.startswith('-'))
+        return self
+
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+
+    @property
+    def data(self):
+        return self.documents
+
+
+class StandInCollection(object):
+    ''' In-memory collection with the part of Query API used by demo '''
+
+    def __init__(self):
+        self.documents = []
+
+    @property
+    def all(self):
+        return StandInQuery(list(self.documents))
+
+    def create(self, **fields):
+        document = type('StandInDocument', (object, ), fields)()
+        self.documents.append(document)
+        return document
+
+    def create_async(self, **fields):
+        future = Future()
+        future.set_result(self.create(**fields))
+        return future
+
+
+class StandInDatabase(object):
+    def __init__(self):
+        self.collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.collections.setdefault(name, StandInCollection())
+
+
+class UsageView(tornado.web.RequestHandler):
+    ''' Resources used by the server process '''
+
+    def get(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * resource.getpagesize()
+        self.write({
+            'rss': rss,
+            'cpu_user': usage.ru_utime,
+            'cpu_system': usage.ru_stime,
+            'stats': self.application.stats()
+        })
+
+
+def make_app_path(port, source=DEMO_PATH):
+    '''
+    Makes temporary application folder with the demo chat package and
+    config without databases. Returns its path.
+    '''
+
+    app_path = tempfile.mkdtemp(prefix='meteor-bench-')
+    for name in ('chat', 'static'):
+        os.symlink(os.path.join(source, name), os.path.join(app_path, name))
+    shutil.copy(os.path.join(source, 'views.cfg'), app_path)
+
+    config = configparser.ConfigParser()
+    config.read(os.path.join(source, 'config.cfg'))
+    for section in config.sections():
+        if section.startswith('database'):
+            config.remove_section(section)
+    config['global']['debug'] = 'False'
+    config['global']['change_builtins'] = 'False'
+    config['server'].update({
+        'host': '127.0.0.1', 'port': str(port), 'processes': '1'
+    })
+    with open(os.path.join(app_path, 'config.cfg'), 'w') as f:
+        config.write(f)
+    return app_path
+
+
+def serve(app_path, rate_limit=False):
+    sys.path.insert(0, app_path)
+    from chat.handlers import NewMessageEvent
+    from meteor.core import Application
+
+    NewMessageEvent.db = StandInDatabase()
+    if not rate_limit:
+        NewMessageEvent.rate_limit = None
+    Application(extra_handlers=[('/benchmark/usage', UsageView)]).run()
+
+
+@tornado.gen.coroutine
+def fetch_usage(port, attempts=1):
+    client = tornado.httpclient.AsyncHTTPClient()
+    url = 'http://127.0.0.1:{0}/benchmark/usage'.format(port)
+    for attempt in range(attempts):
+        try:
+            response = yield client.fetch(url)
+            return json.loads(response.body.decode('utf-8'))
+        except (OSError, tornado.httpclient.HTTPError):
+            if attempt == attempts - 1:
+                raise
+            yield tornado.gen.sleep(0.1)
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+@tornado.gen.coroutine
+def drive(port, clients=100, rate=200, duration=10.0, drain=1.0):
+    ''' Connects clients, sends messages and collects results '''
+
+    before_connect = yield fetch_usage(port, attempts=100)
+
+    url = 'ws://127.0.0.1:{0}/ws_connection'.format(port)
+    connections = []
+    for i in range(clients):
+        connection = yield tornado.websocket.websocket_connect(url)
+        connections.append(connection)
+    after_connect = yield fetch_usage(port)
+
+    latencies = []
+
+    @tornado.gen.coroutine
+    def receive(connection):
+        while True:
+            message = yield connection.read_message()
+            if message is None:
+                return
+            received = time.time()
+            messages = json.loads(message)
+            if not isinstance(messages, list):
+                messages = [messages]
+            for message in messages:
+                if message.get('event') == 'chat/new_message':
+                    sent = float(message['data']['msg'])
+                    latencies.append(received - sent)
+
+    for connection in connections:
+        tornado.ioloop.IOLoop.current().add_future(receive(connection),
+            lambda f: f.result())
+
+    # messages are sent by clients in turn at the target rate
+    sent = 0
+    interval = 1.0 / rate
+    start = time.time()
+    while time.time() - start < duration:
+        connections[sent % clients].write_message(json.dumps({
+            'event': 'chat/new_message', 'data': {'msg': repr(time.time())}
+        }))
+        sent += 1
+        delay = start + sent * interval - time.time()
+        if delay > 0:
+            yield tornado.gen.sleep(delay)
+    elapsed = time.time() - start
+    yield tornado.gen.sleep(drain)
+    after_run = yield fetch_usage(port)
+
+    for connection in connections:
+        connection.close()
+
+    latencies.sort()
+    cpu = sum(after_run[k] - after_connect[k]
+        for k in ('cpu_user', 'cpu_system'))
+    return {
+        'clients': clients,
+        'target_rate': rate,
+        'duration': elapsed,
+        'sent': sent,
+        'delivered': len(latencies),
+        'expected': sent * clients,
+        'throughput': {
+            'sent_per_sec': sent / elapsed,
+            'delivered_per_sec': len(latencies) / elapsed
+        },
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000 if latencies else None,
+            'p99': percentile(latencies, 99) * 1000 if latencies else None,
+            'max': latencies[-1] * 1000 if latencies else None
+        },
+        'memory_per_connection':
+            (after_connect['rss'] - before_connect['rss']) / clients,
+        'server_rss': after_run['rss'],
+        'cpu': {
+            'user': after_run['cpu_user'] - after_connect['cpu_user'],
+            'system': after_run['cpu_system'] - after_connect['cpu_system'],
+            'percent': cpu / elapsed * 100
+        },
+        'server_stats': after_run['stats']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Websocket load test')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=200,
+        help='messages per second sent by all the clients')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8890)
+    parser.add_argument('--app-path', default=DEMO_PATH,
+        help='application with "chat" package')
+    parser.add_argument('--rate-limit', action='store_true',
+        help='keep rate limit of chat/new_message')
+    parser.add_argument('--output', help='JSON file, stdout by default')
+    args = parser.parse_args()
+
+    app_path = make_app_path(args.port, args.app_path)
+    server = multiprocessing.Process(target=serve,
+        args=(app_path, args.rate_limit))
+    server.start()
+    try:
+        results = tornado.ioloop.IOLoop.current().run_sync(
+            lambda: drive(args.port, args.clients, args.rate, args.duration))
+    finally:
+        server.terminate()
+        server.join()
+        shutil.rmtree(app_path)
+
+    output = json.dumps(results, indent=4, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import atexit
+import errno
+import hashlib
+import json
+import logging
+import os
+import socket
+import stat
+import tempfile
+import time
+
+import tornado.ioloop
+
+from .exceptions import ConfigurationError
+
+
+class BroadcastBus(object):
+    '''
+    Basic broadcast bus. Broadcasts never leave the current process, so it is
+    used when application runs in single process.
+
+    Bus subclasses forward each broadcast to sibling processes, where it is
+    passed to "deliver" callback given to "start" method. Each process
+    delivers broadcast to its own connections only.
+    '''
+
+    def __init__(self, app_id=None):
+        # identifies application, so buses of different applications of
+        # the same host never mix broadcasts
+        self.app_id = app_id
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def stop(self):
+        pass
+
+    def publish(self, broadcast):
+        ''' Forwards broadcast (dict of broadcast arguments) to siblings '''
+        return 0
+
+
+class UnixSocketBus(BroadcastBus):
+    '''
+    Forwards broadcasts to processes of the same host through unix datagram
+    sockets. Each process binds a socket named by its pid in the shared
+    directory and sends broadcasts to all the other sockets in it. No outside
+    broker is required. Socket name is chosen by "start", which is called
+    after workers are forked, so each worker has its own one.
+
+    Directory is private to the application: by default its name is derived
+    from the application id, it must be owned by the current user and be
+    accessible by that user only (mode 0700), so nobody else can send to the
+    sockets. Broadcast arguments are serialized to JSON. Datagram size is
+    limited by the kernel (see net.core.wmem_default), bigger broadcasts are
+    not forwarded.
+    '''
+
+    def __init__(self, app_id=None, path=None, name=None, peers_refresh=1.0):
+        super(UnixSocketBus, self).__init__(app_id)
+        self.path = path or self.default_path(app_id)
+        self.default_name = name
+        self.name = None
+        self.peers_refresh = peers_refresh
+        self.peers = []
+        self.peers_updated = 0
+        self.socket = None
+        self.buffer = bytearray(1 << 20)
+
+    @staticmethod
+    def default_path(app_id=None):
+        digest = hashlib.sha1(str(app_id).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(tempfile.gettempdir(),
+            'meteor-bus-{0}-{1}'.format(os.getuid(), digest))
+
+    @property
+    def address(self):
+        return os.path.join(self.path, self.name + '.sock')
+
+    def start(self, deliver):
+        super(UnixSocketBus, self).start(deliver)
+        self.name = self.default_name or str(os.getpid())
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, 0o700)
+        self.check_path()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(self.address)
+
+        io_loop = tornado.ioloop.IOLoop.current()
+        io_loop.add_handler(self.socket.fileno(), self._on_read, io_loop.READ)
+        atexit.register(self.stop)
+
+    def check_path(self):
+        ''' Refuses directory which other users may write to '''
+
+        info = os.lstat(self.path)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or \
+            stat.S_IMODE(info.st_mode) != 0o700:
+                raise ConfigurationError.unsafe_bus_path_exc(self.path)
+
+    def stop(self):
+        if self.socket is None:
+            return
+        tornado.ioloop.IOLoop.current().remove_handler(self.socket.fileno())
+        self.socket.close()
+        self.socket = None
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def get_peers(self):
+        # directory is listed at most once per "peers_refresh" seconds
+        if time.time() - self.peers_updated > self.peers_refresh:
+            self.peers = [os.path.join(self.path, f)
+                for f in os.listdir(self.path)
+                if f.endswith('.sock') and f != self.name + '.sock']
+            self.peers_updated = time.time()
+        return self.peers
+
+    def publish(self, broadcast):
+        ''' Sends broadcast to all the siblings. Returns count of them '''
+
+        if self.socket is None:
+            return 0
+
+        payload = json.dumps(broadcast, default=self.serialize).encode('utf-8')
+        sent = 0
+        for peer in self.get_peers():
+            try:
+                self.socket.sendto(payload, peer)
+                sent += 1
+            except (FileNotFoundError, ConnectionRefusedError):
+                # sibling is gone, drop its stale socket
+                self._remove_peer(peer)
+            except OSError as error:
+                if error.errno in (errno.EAGAIN, errno.EMSGSIZE, errno.ENOBUFS):
+                    logging.warning('Broadcast was not forwarded to "{0}": {1}' \
+                        .format(peer, error))
+                else:
+                    raise
+        return sent
+
+    @staticmethod
+    def serialize(value):
+        ''' Serializes users and channels criteria which are not JSON '''
+
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        raise TypeError('{0} is not JSON serializable'.format(repr(value)))
+
+    def _remove_peer(self, peer):
+        try:
+            os.unlink(peer)
+        except OSError:
+            pass
+        if peer in self.peers:
+            self.peers.remove(peer)
+
+    def _on_read(self, fd, events):
+        while True:
+            try:
+                size = self.socket.recv_into(self.buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                broadcast = json.loads(self.buffer[:size].decode('utf-8'))
+                self.deliver(**broadcast)
+            except Exception:
+                logging.exception('Failed to deliver forwarded broadcast')
+
+
+buses = {
+    'local': BroadcastBus,
+    'unix': UnixSocketBus
+}
+
+
+def create_bus(backend='local', app_id=None, **options):
+    if not backend in buses:
+        raise ConfigurationError.option_value_exc('bus', 'backend', backend,
+            sorted(buses))
+    return buses[backend](app_id, **options)
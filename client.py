@@ -1,12 +1,14 @@
 import os
 
-from .helpers.lists import distinct
+from . import assets
+from .exceptions import StaticError
 
 
 class StaticManager(object):
     def __init__(self, static_path, libs_requirements, packages):
         self.static_path = static_path
         self.libs = {'js': {}, 'css': {}}
+        self.bundles = {}
 
         # gather static libs with requirements
         for filename, requirements in libs_requirements.items():
@@ -23,6 +25,8 @@ class StaticManager(object):
         for package in packages:
             self.find_libs(package.name, True)
 
+        self.resolve_chains()
+
     def append_lib(self, path, name, ext, require=(), package=None):
         lib = StaticLib(self.static_path, path, name, ext, require, package)
         if not lib.full_name in self.libs[ext]:
@@ -38,22 +42,76 @@ class StaticManager(object):
                     require = ('meteor', ) if is_package and ext == 'js' else ()
                     self.append_lib(path, name, ext, require, package)
 
-    def get_chain(self, ext, package=None):
+    def resolve_chains(self):
+        '''
+        Resolves chains of all the packages once, so "get_chain" is a dict
+        lookup. Raises StaticError on missing or cyclic requirements.
+        '''
+
+        self.chains = {}
+        packages = set(lib.package for libs in self.libs.values()
+            for lib in libs.values())
+        for ext in self.libs:
+            for package in packages | set([None]):
+                self.chains[(ext, package)] = self.resolve_chain(ext, package)
+
+    def get_chain(self, ext, package=None, minified=False):
+        key = (ext, package or None)
+        if minified and key in self.bundles:
+            return self.bundles[key]
+        if not key in self.chains:
+            self.chains[key] = self.resolve_chain(ext, package)
+        return self.chains[key]
+
+    def load_manifest(self):
+        '''
+        Switches minified static to files built by asset pipeline if its
+        manifest exists. Returns True if it was loaded.
+        '''
+
+        manifest = assets.load_manifest(self.static_path)
+        if manifest is None:
+            return False
+        for ext, paths in manifest['libs'].items():
+            for name, path in paths.items():
+                if name in self.libs.get(ext, {}):
+                    self.libs[ext][name].hashed_path = path
+        for ext, paths in manifest['bundles'].items():
+            for package, path in paths.items():
+                self.bundles[(ext, package or None)] = \
+                    [StaticBundle(path, ext, package or None)]
+        return True
+
+    def resolve_chain(self, ext, package=None):
+        '''
+        Returns libs of the package and common libs sorted topologically:
+        each lib follows all of its requirements.
+        '''
+
+        libs = self.libs[ext]
         result = []
-        for lib in self.libs[ext].values():
+        done = set()
+        path = []
+
+        def visit(lib):
+            if lib.full_name in done:
+                return
+            if lib in path:
+                chain = path[path.index(lib):] + [lib]
+                raise StaticError.cyclic_requirements_exc(chain)
+            path.append(lib)
+            for req in lib.require:
+                if not req in libs:
+                    raise StaticError.missing_requirement_exc(lib, req)
+                visit(libs[req])
+            path.pop()
+            done.add(lib.full_name)
+            result.append(lib)
+
+        for lib in libs.values():
             if (package and lib.package == package) or lib.package is None:
-                result.extend(self.get_lib_chain(lib.full_name, ext))
-        return distinct(result)
-
-    def get_lib_chain(self, libname, ext):
-        lib = self.libs[ext][libname]
-
-        result = []
-        for req in lib.require:
-            result.extend(self.get_lib_chain(req, ext))
-
-        result.append(lib)
-        return distinct(result)
+                visit(lib)
+        return result
 
     def parse_filename(self, filename):
         name = ''.join(filename.split('.')[:-1])
@@ -69,13 +127,25 @@ class StaticLib(object):
         self.ext = ext
         self.require = require
         self.package = package
+        self.hashed_path = None
 
     @property
     def full_name(self):
         return '/'.join([self.package, self.name]) \
             if self.package else self.name
 
+    def get_source_path(self):
+        return os.path.join(self.path, '{0}.{1}'.format(self.name, self.ext))
+
+    def get_minified_path(self):
+        return os.path.join(self.path, 'compressed',
+            '{0}-min.{1}'.format(self.name, self.ext))
+
     def get_relative_path(self, minified=False):
+        # content-hashed file built by asset pipeline
+        if minified and self.hashed_path:
+            return self.hashed_path
+
         path = self.path.replace(self.static_path, '')
         if minified:
             result = os.path.join(
@@ -86,3 +156,18 @@ class StaticLib(object):
 
     def __str__(self):
         return self.full_name
+
+
+class StaticBundle(object):
+    ''' Bundle of the whole package chain built by asset pipeline '''
+
+    def __init__(self, path, ext, package=None):
+        self.path = path
+        self.ext = ext
+        self.package = package
+
+    def get_relative_path(self, minified=True):
+        return self.path
+
+    def __str__(self):
+        return self.path
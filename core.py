@@ -8,30 +8,44 @@ import sys
 import tornado.httpserver
 import tornado.ioloop
 import tornado.locale
+import tornado.netutil
+import tornado.process
 import tornado.web
 
 from string import ascii_lowercase
 
+from .assets import AssetBuilder
+from .bus import create_bus
 from .client import StaticManager
 from .handlers import EventHandler, View, WSConnection
 from .helpers import log
+from .metrics import StatsView
 from .helpers.dictonaries import extend
 from .odm import selectors
 from .odm import modifiers
 from .odm.core import Database
 from .packages import PackagesManager, Package
+from .staticfiles import create_static_handler
+from .stream import StreamConnection
+from .template import filters
+from .template import loader as template_loader
 
 
 class Application(tornado.web.Application):
+    # set by "--build-static" command line option: application only builds
+    # static assets and does not start
+    build_only = False
+
     def __init__(self, extra_handlers=(), extra_settings={}, extra_packages=(),
             exclude_packages=(), extra_static_libs_requirements={},
-            ws_connection=WSConnection):
+            ws_connection=WSConnection, stream_connection=StreamConnection,
+            stats_view=StatsView):
 
         # define paths
         app_path = sys.path[0]
 
         # configure app
-        (self.address, self.port), databases, settings, \
+        (self.address, self.port, self.processes), databases, settings, \
             self.views_metadata, log_config,= Configurator(app_path).data
 
         # gather packages
@@ -42,6 +56,16 @@ class Application(tornado.web.Application):
             if not package.name in exclude_packages:
                 self.package_manager.packages.append(package)
 
+        # "--build-static" needs static libs only, so neither databases nor
+        # routes are created
+        if self.build_only:
+            log.configure(**log_config)
+            static_path = dict(settings, **extra_settings).get('static_path',
+                os.path.join(app_path, 'static'))
+            AssetBuilder(self.create_static_manager(static_path,
+                extra_static_libs_requirements)).build()
+            return
+
         # creating databases
         self.databases = {}
         schemes = self.package_manager.get_all('schemes')
@@ -52,8 +76,23 @@ class Application(tornado.web.Application):
         # make routes
         if not WSConnection in ws_connection.__mro__:
             raise # TODO: make expression
+        ws_connection.check_options(settings['websocket'])
         self.ws_connection = ws_connection
-        self.router = Router(self.package_manager.packages, ws_connection)
+        self.bus = create_bus(app_id='{0}:{1}'.format(app_path, self.port),
+            **settings['bus'])
+        if self.processes != 1 and \
+            settings['bus'].get('backend', 'local') == 'local':
+                logging.warning('Broadcasts are not forwarded between {0} '
+                    'processes by "local" bus, use "unix" backend' \
+                    .format(self.processes))
+        if settings['websocket'].get('presence_events', False):
+            ws_connection.presence.subscribe(ws_connection.broadcast_presence)
+        self.package_manager.resolve_packages()
+        self.stream_connection = stream_connection \
+            if settings['stream'].get('enabled', False) else None
+        self.router = Router(self.package_manager.packages, ws_connection,
+            self.databases, settings['websocket'].get('stats_url', None),
+            self.stream_connection, stats_view)
         handlers = self.router.routes
 
         # configure logging
@@ -61,31 +100,90 @@ class Application(tornado.web.Application):
 
         # extend by extra params
         handlers.extend(extra_handlers)
+        self.router.bind_extra_handlers(extra_handlers, self.databases)
         settings.update(extra_settings)
 
+        # autoreload is incompatible with forked workers, debug turns it on
+        if self.processes != 1 and \
+            settings.get('autoreload', settings.get('debug', False)):
+                logging.warning('Autoreload is disabled, application runs '
+                    'in {0} processes'.format(self.processes))
+                settings['autoreload'] = False
+
         # define static path
         if not 'static_path' in settings:
             settings['static_path'] = os.path.join(app_path, 'static')
 
         # gather static libs
-        requirements = {'meteor.js': ['jquery']}
-        requirements = extend(requirements, extra_static_libs_requirements)
-        self.static_manager = StaticManager(settings['static_path'],
-            requirements, self.package_manager.packages)
+        self.static_manager = self.create_static_manager(
+            settings['static_path'], extra_static_libs_requirements)
+
+        # content-hashed bundles are used as minified static if built
+        if settings.get('build_static', False):
+            AssetBuilder(self.static_manager).build()
+        if settings.get('use_compressed_static', False):
+            self.static_manager.load_manifest()
+
+        # static handler is chosen by the "static" config section unless
+        # it is set explicitly
+        static_options = settings.pop('static')
+        if not 'static_handler_class' in settings:
+            settings['static_handler_class'] = create_static_handler(
+                settings['static_path'], **static_options)
 
         # call parent __init__ method
         super(Application, self).__init__(handlers, **settings)
 
+        # compile templates before the first request, templates are compiled
+        # on each request in debug mode anyway
+        self.template_loaders = {}
+        templates = self.settings['templates']
+        if templates.get('precompile', False) and \
+            self.settings.get('compiled_template_cache', True) and \
+            not 'template_loader' in self.settings:
+                self.precompile_templates(templates.get('cache_path', None))
+
+    def create_static_manager(self, static_path, extra_requirements={}):
+        requirements = {'meteor.js': ['jquery']}
+        requirements = extend(requirements, extra_requirements)
+        return StaticManager(static_path, requirements,
+            self.package_manager.packages)
+
+    def precompile_templates(self, cache_path=None):
+        options = {}
+        if 'autoescape' in self.settings:
+            options['autoescape'] = self.settings['autoescape']
+        if 'template_whitespace' in self.settings:
+            options['whitespace'] = self.settings['template_whitespace']
+
+        paths = set(view.template_dir()
+            for view in self.package_manager.get_all('views'))
+        self.template_loaders = template_loader.precompile(sorted(paths),
+            View.wrapper_path, cache_path or None, **options)
+
     def run(self):
+        if self.build_only:
+            return
         try:
+            sockets = tornado.netutil.bind_sockets(self.port, self.address)
+            if self.processes != 1:
+                # each worker holds its own connections, broadcasts are
+                # forwarded between workers by the bus
+                tornado.process.fork_processes(self.processes)
+
             http_server = tornado.httpserver.HTTPServer(self)
-            http_server.listen(address=self.address, port=self.port)
+            http_server.add_sockets(sockets)
+            self.bus.start(self.ws_connection.deliver)
             logging.info('Application started on %s:%d' % (self.address,
                 self.port))
             tornado.ioloop.IOLoop.instance().start()
         except Exception as error:
             logging.error('Application failed. Details: %s' % error)
 
+    def stats(self):
+        ''' Snapshot of websocket statistics of the current process '''
+        return self.ws_connection.stats_snapshot()
+
 
 class Configurator(object):
     def __init__(self, app_path):
@@ -96,10 +194,14 @@ class Configurator(object):
         # define default values
         address = 'localhost'
         port = 8888
+        processes = 1
         log_config = {'level': 'info', 'colored': False}
         quiet_output = True
 
-        settings = {}
+        settings = {
+            'websocket': {}, 'bus': {}, 'stream': {}, 'templates': {},
+            'static': {}
+        }
         databases = {}
 
         # TODO: if must be ordered dict - check!
@@ -114,6 +216,7 @@ class Configurator(object):
                 settings['default_locale'] = opts.get('default_locale', 'en')
                 settings['use_compressed_static'] =\
                     opts.get('use_compressed_static', False)
+                settings['build_static'] = opts.get('build_static', False)
 
                 if opts.get('debug', False):
                     log_config['level'] = 'debug'
@@ -122,8 +225,11 @@ class Configurator(object):
             elif k == 'server':
                 address = opts.get('host', 'localhost')
                 port = opts.get('port', 8888)
+                processes = opts.get('processes', 1)
             elif k == 'settings':
                 settings.update(opts)
+            elif k in ('websocket', 'bus', 'stream', 'templates', 'static'):
+                settings[k].update(opts)
             elif k.startswith('database'):
                 alias = k.split(':')[1]
                 opts['quiet_output'] = quiet_output
@@ -156,7 +262,7 @@ class Configurator(object):
                     } for k, v in opts.items()
                 ])
 
-        self._data = ((address, port), databases, settings,
+        self._data = ((address, port, processes), databases, settings,
             views_metadata, log_config)
 
     @property
@@ -179,19 +285,72 @@ class Configurator(object):
 
 
 class Router(object):
-    def __init__(self, packages, ws_connection):
+    def __init__(self, packages, ws_connection, databases={}, stats_url=None,
+            stream_connection=None, stats_view=StatsView):
         self.routes = [('/ws_connection/?', ws_connection)]
         self.events = {}
 
+        # fallback transport for clients which can not use websockets
+        if stream_connection is not None:
+            self.routes.append(
+                (r'/stream_connection/?([0-9a-f]*)', stream_connection))
+
+        # read-only JSON statistics of websocket dispatch
+        if stats_url:
+            self.routes.append((stats_url, stats_view))
+
+        # bind databases once per class instead of per request or message
+        self.bind_databases(ws_connection, databases)
+        if stream_connection is not None:
+            self.bind_databases(stream_connection.session_class, databases)
+
+        global_filters = filters.get_filters(filters)
         for package in packages:
+            package_filters = dict(global_filters,
+                **getattr(package, 'filters', {}))
             for view in getattr(package, 'views', []):
+                self.bind_databases(view, databases)
+                if view.package == package.name:
+                    view.template_filters = package_filters
                 if hasattr(view, 'url'):
                     url = r'{0}{1}?'.format(
                         view.url, '/' if not view.url.endswith('/') else ''
                     )
                     self.routes.append((url, view))
             for handler in getattr(package, 'handlers', []):
+                self.bind_databases(handler, databases)
                 if hasattr(handler, 'event'):
                     event = r'{0}/{1}'.format(package.name, handler.event)
+                    if handler.package == package.name:
+                        handler.event_fullname = event
                     self.events[event] = handler
+                    if handler.history_size:
+                        self.track_history(ws_connection, event, handler)
             # TODO: add FormBehaviour parsing
+
+        # event table of the compact protocol, event id is index + 1
+        self.event_names = sorted(
+            set(self.events) | set(ws_connection.system_events))
+        self.event_ids = {
+            name: i + 1 for i, name in enumerate(self.event_names)
+        }
+
+    def track_history(self, ws_connection, event, handler):
+        backfill = [{'event': event, 'data': data}
+            for data in handler.history_backfill()]
+        ws_connection.history.track(event, handler.history_size, backfill)
+
+    def bind_extra_handlers(self, handlers, databases):
+        ''' Binds databases to views passed by "extra_handlers" '''
+
+        for spec in handlers:
+            if isinstance(spec, (list, tuple)):
+                handler = spec[1] if len(spec) > 1 else None
+            else:
+                handler = getattr(spec, 'target', None)
+            if inspect.isclass(handler) and issubclass(handler, View):
+                self.bind_databases(handler, databases)
+
+    def bind_databases(self, cls, databases):
+        for name, ref in databases.items():
+            setattr(cls, name, ref)
@@ -1,13 +1,25 @@
 from meteor.handlers import EventHandler
+from tornado import gen
 
 import time
 
 
 class NewMessageEvent(EventHandler):
     event = 'new_message'
+    rate_limit = 5
+    rate_burst = 10
+    history_size = 50
 
+    @classmethod
+    def history_backfill(cls):
+        messages = cls.db.messages.all.sort('-timestamp') \
+            .limit(cls.history_size).data
+        return [{'user': m.user, 'msg': m.content, 'system': m.system}
+            for m in reversed(messages)]
+
+    @gen.coroutine
     def handling(self, data):
-        self.db.messages.create(user=self.current_user,
+        yield self.db.messages.create_async(user=self.current_user,
             content=data['msg'], timestamp=int(time.time()))
 
         self.broadcast(event=self.event_fullname,
@@ -9,12 +9,13 @@ class ChatView(View):
 
     @authenticated
     def get(self):
-        # get other users count
-        count = len(self.application.ws_connection.users)
-        if self.current_user in [c.current_user \
-            for c in self.application.ws_connection.users]:
-                count -= 1
+        # get count of other live connections, anonymous ones included
+        ws_connection = self.application.ws_connection
+        presence = ws_connection.presence
+        count = presence.connections_count - len(presence.get_connections(
+            ws_connection.presence_key(self.current_user)))
 
-        # get history
-        history = self.db.messages.all.sort('timestamp').limit(50).data
+        # get history without database round trip
+        history = [message['data'] for message in
+            self.application.ws_connection.history.recent('chat/new_message')]
         self.render_view('index.html', history=history, count=count)
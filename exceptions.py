@@ -17,6 +17,23 @@ class ClassmethodError(MeteorError):
         )
 
 
+class ConfigurationError(MeteorError):
+    @classmethod
+    def option_value_exc(self, section, option, value, allowed):
+        return self(
+            'Option "{0}" of config section "{1}" must be {2}, not "{3}"' \
+            .format(option, section,
+                ' or '.join('"%s"' % v for v in allowed), value)
+        )
+
+    @classmethod
+    def unsafe_bus_path_exc(self, path):
+        return self(
+            '''Bus directory "{0}" must be owned by the current user and have \
+            mode 0700'''.format(path)
+        )
+
+
 class InitializationError(MeteorError):
     @classmethod
     def empty_fieldset_exc(self, classname):
@@ -184,3 +201,46 @@ class QueryError(MeteorError):
             '''Subset must be either the inclusion or exclusion of fields.\
             \nDescription: subset query contains {0}'''.format(str(subset))
         )
+
+
+class StaticError(MeteorError):
+    @classmethod
+    def missing_requirement_exc(self, lib, requirement):
+        return self(
+            'Static lib "{0}" requires "{1}" which is not found' \
+            .format(lib, requirement)
+        )
+
+    @classmethod
+    def cyclic_requirements_exc(self, chain):
+        return self(
+            'Static libs have cyclic requirements: {0}' \
+            .format(' -> '.join('"%s"' % lib for lib in chain))
+        )
+
+
+class ProtocolError(MeteorError):
+    @classmethod
+    def event_id_exc(self, event_id, count):
+        return self(
+            'Event id {0} is out of the event table of {1} events' \
+            .format(event_id, count)
+        )
+
+    @classmethod
+    def event_name_exc(self, event):
+        return self(
+            'Event name must be a string, not "{0}"'.format(
+                type(event).__name__)
+        )
+
+    @classmethod
+    def message_type_exc(self, message):
+        return self(
+            'Message must be an object, not "{0}"'.format(
+                type(message).__name__)
+        )
+
+    @classmethod
+    def malformed_message_exc(self, error):
+        return self('Malformed message: {0}'.format(error))
@@ -1,59 +1,887 @@
+import abc
+import collections
 import logging
 import re
 import inspect
 import os
 import sys
+import time
+import zlib
 
+import tornado.gen
+import tornado.ioloop
+import tornado.iostream
 import tornado.web
 import tornado.websocket
-import tornado.util
-from tornado.escape import json_encode, json_decode
+from tornado.concurrent import is_future
+from tornado.escape import json_decode
 
+from .exceptions import ConfigurationError, ProtocolError
+from .helpers.ratelimit import TokenBucket
+from .helpers.timerwheel import TimerWheel
+from .history import History
+from .metrics import Metrics
+from .presence import Presence
+from .protocol import OutboundMessage, make_frame, decode_message, \
+    encode_batch, deflate, deflate_memory, inflate_memory, OPCODE_TEXT, \
+    OPCODE_BINARY, FLAG_DEFLATE, COMPACT_SUBPROTOCOL
 from .template import filters
 
 
-class WSConnection(tornado.websocket.WebSocketHandler):
+class Connection(object, metaclass=abc.ABCMeta):
+    '''
+    Transport independent part of client connection: dispatching of incoming
+    messages, channels, presence and broadcasts. Transport subclass sets
+    "options", calls "init_connection" and "register" once connection is
+    open and implements abstract "push" of OutboundMessage.
+    '''
+
+    # name of the transport used for connections accounting
+    transport = None
+
     users = set()
 
-    def __init__(self, *args, **kwargs):
-        super(WSConnection, self).__init__(*args, **kwargs)
-        for name, ref in self.application.databases.items():
-            setattr(self, name, ref)
+    # subscriptions index: channel name -> set of connections
+    channels = {}
 
-    def open(self):
-        WSConnection.users.add(self)
+    # online users registry: current user -> set of connections
+    presence = Presence()
+
+    # dispatch metrics of all the connections grouped by event name
+    metrics = Metrics()
+
+    # rings of recent broadcasts by event name or channel
+    history = History()
+
+    # count of open connections by transport
+    transports = {}
+
+    # events handled by the connection itself
+    system_events = {
+        'meteor/batch': 'on_batch',
+        'meteor/join': 'on_join',
+        'meteor/leave': 'on_leave'
+    }
+
+    # default values of the options shared by all the transports
+    default_options = {
+        'max_buffer_size': 1048576,
+        'rate_limit': 0,
+        'rate_burst': 0,
+        'max_channels': 64,
+        'max_channel_length': 128
+    }
+
+    # timer wheel which drives timers of all the connections
+    timers = None
+
+    # counters of messages rejected by rate limits of all the connections
+    rejected_totals = {}
+
+    def init_connection(self):
+        self.bucket = TokenBucket(self.options['rate_limit'],
+            self.options['rate_burst']) if self.options['rate_limit'] else None
+        self.event_buckets = {}
+        self.rejected = {}
+        self.subscriptions = set()
+        self.inbound = collections.deque()
+        self.dispatching = False
+        self.last_activity = time.time()
+
+    @classmethod
+    def schedule(cls, delay, callback, tick=1.0):
+        ''' Schedules callback on the shared timer wheel '''
+
+        if Connection.timers is None:
+            Connection.timers = TimerWheel(tick)
+        return Connection.timers.schedule(delay, callback)
+
+    def register(self):
+        ''' Includes connection into broadcasts and presence '''
+
+        Connection.users.add(self)
+        self.presence_id = self.presence_key(self.current_user)
+        Connection.presence.add(self.presence_id, self)
+        Connection.transports[self.transport] = \
+            Connection.transports.get(self.transport, 0) + 1
+
+    def unregister(self):
+        ''' Excludes connection from broadcasts, channels and presence '''
 
-    def on_close(self):
         try:
-            WSConnection.users.remove(self)
+            Connection.users.remove(self)
         except KeyError:
-            pass
+            return
+        self.leave(*self.subscriptions)
+        Connection.presence.remove(self.presence_id, self)
+        Connection.transports[self.transport] -= 1
+
+    @classmethod
+    def presence_key(cls, user):
+        '''
+        Returns hashable key of the user in presence registry and "users"
+        criteria of broadcasts: "id" attribute or item of the user, decoded
+        bytes, the user itself if it is a string or number or str(user).
+        None means anonymous user. Override if users are identified other way.
+        '''
+
+        if user is None or isinstance(user, (str, int)):
+            return user
+        if isinstance(user, bytes):
+            return user.decode('utf-8')
+        key = user.get('id', None) if isinstance(user, dict) \
+            else getattr(user, 'id', None)
+        return key if key is not None else str(user)
+
+    @abc.abstractmethod
+    def push(self, message, critical=True):
+        '''
+        Sends OutboundMessage instance by the transport. Returns count of
+        bytes sent or queued.
+        '''
 
     def on_message(self, message):
-        message = json_decode(message)
-        if 'event' in message:
+        self.last_activity = time.time()
+
+        # connection rate limit is checked before anything is decoded
+        if self.bucket is not None and not self.bucket.consume():
+            self.reject('*')
+            return
+
+        # messages of one connection are dispatched strictly in order, so
+        # the next one waits until asynchronous handling of previous is done
+        self.inbound.append((message, None))
+        if not self.dispatching:
+            self.dispatch_inbound()
+
+    def dispatch_inbound(self):
+        self.dispatching = True
+        while self.inbound:
+            message, batch = self.inbound.popleft()
+            if message is None:
+                # all the batch events are handled, send combined reply
+                self.write_message({'event': 'meteor/batch',
+                    'timestamp': batch.timestamp, 'data': batch.answers})
+                continue
+            try:
+                future = self.dispatch(message, batch)
+            except ProtocolError as error:
+                self.reject('!protocol')
+                logging.warning(str(error))
+                continue
+            except Exception:
+                logging.exception('Event handling failed')
+                continue
+            if future is not None:
+                tornado.ioloop.IOLoop.current().add_future(
+                    future, self._on_dispatched)
+                return
+        self.dispatching = False
+
+    def _on_dispatched(self, future):
+        try:
+            future.result()
+        except Exception:
+            logging.exception('Asynchronous event handling failed')
+        self.dispatch_inbound()
+
+    def dispatch(self, message, batch=None):
+        '''
+        Dispatches message to the event handler. Returns Future if handling
+        is a coroutine or returns a Future, otherwise None. Array of messages
+        is dispatched in order as batch without combined reply.
+        '''
+
+        decode_time = 0
+        if isinstance(message, (bytes, str)):
+            start = time.perf_counter()
+            if isinstance(message, bytes):
+                message = decode_message(message,
+                    self.application.router.event_names)
+            else:
+                try:
+                    message = json_decode(message)
+                except ValueError as error:
+                    raise ProtocolError.malformed_message_exc(error)
+            decode_time = time.perf_counter() - start
+            Connection.metrics.decode.add(decode_time)
+
+        # items of batch are dispatched one by one and checked here too
+        if not isinstance(message, (dict, list)):
+            raise ProtocolError.message_type_exc(message)
+
+        if isinstance(message, list):
+            self.on_batch(message)
+        elif 'event' in message:
+            if not isinstance(message['event'], str):
+                raise ProtocolError.event_name_exc(message['event'])
+            if message['event'] in self.system_events:
+                method = getattr(self, self.system_events[message['event']])
+                method(message.get('data', {}), message.get('timestamp', None))
+                return
+
             Handler = self.application.router.events.get(message['event'], None)
             if Handler:
-                handler = Handler(self)
-                handler.timestamp = message.get('timestamp', None)
-                handler.prepare()
-                handler.handling(message.get('data', {}))
+                if Handler.rate_limit and \
+                    not self.event_bucket(Handler).consume():
+                        self.reject(message['event'])
+                        return
+
+                stats = Connection.metrics.event(message['event'])
+                stats.received(decode_time)
+                start = time.perf_counter()
+
+                handler = Handler.acquire(self, message.get('timestamp', None),
+                    batch)
+                try:
+                    handler.prepare()
+                    result = handler.handling(message.get('data', {}))
+                except Exception:
+                    stats.handled(time.perf_counter() - start, True)
+                    raise
+
+                if is_future(result) or inspect.isawaitable(result):
+                    def on_handled(future):
+                        stats.handled(time.perf_counter() - start,
+                            future.exception() is not None)
+                        Handler.release(handler)
+
+                    future = tornado.gen.convert_yielded(result)
+                    future.add_done_callback(on_handled)
+                    return future
+                stats.handled(time.perf_counter() - start)
+                Handler.release(handler)
+
+    def event_bucket(self, Handler):
+        if not Handler in self.event_buckets:
+            self.event_buckets[Handler] = TokenBucket(Handler.rate_limit,
+                Handler.rate_burst)
+        return self.event_buckets[Handler]
+
+    def reject(self, key):
+        '''
+        Counts rejected message by event name, by "*" if it was rejected by
+        connection rate limit or by "!protocol" if it was malformed
+        '''
+
+        for counters in (self.rejected, Connection.rejected_totals):
+            counters[key] = counters.get(key, 0) + 1
+        logging.debug('Message rejected ({0})'.format(key))
+
+    def allow_subscription(self, channel):
+        ''' Override to restrict channels the client may join by itself '''
+        return True
+
+    def allow_join(self, channel):
+        '''
+        Checks channel name and count of subscriptions ("max_channels", 0 is
+        unlimited) before the client joins channel by itself
+        '''
+
+        if not channel or len(channel) > self.options['max_channel_length']:
+            return False
+        if channel in self.subscriptions:
+            return True
+        limit = self.options['max_channels']
+        if limit and len(self.subscriptions) >= limit:
+            self.reject('meteor/join')
+            return False
+        return True
 
-    def write_message(self, message):
-        super(WSConnection, self).write_message(json_encode(message))
+    def join(self, *channels):
+        for channel in channels:
+            Connection.channels.setdefault(channel, set()).add(self)
+            self.subscriptions.add(channel)
 
-    def broadcast(self, event, data, **kwargs):
-        # TODO: add criteria
+    def leave(self, *channels):
+        for channel in channels:
+            self._discard(Connection.channels, channel)
+            self.subscriptions.discard(channel)
+
+    def on_join(self, data, timestamp=None):
+        channel = data.get('channel', None) if isinstance(data, dict) \
+            else None
+        if not isinstance(channel, str):
+            channel = None
+        joined = self.allow_join(channel) and \
+            self.allow_subscription(channel)
+        if joined:
+            self.join(channel)
+        if timestamp:
+            self.write_message({'event': 'meteor/join', 'timestamp': timestamp,
+                'data': {'channel': channel, 'joined': joined}})
+
+    def on_batch(self, data, timestamp=None):
+        '''
+        Queues batch of messages to be dispatched in order before any other
+        message. If batch has timestamp answers of its events are sent as
+        single "meteor/batch" reply keyed by timestamps of the events.
+        '''
+
+        if not isinstance(data, list) or not data:
+            return
+
+        # frame itself was already counted by connection rate limit
+        if self.bucket is not None and len(data) > 1 and \
+            not self.bucket.consume(len(data) - 1):
+                self.reject('*')
+                return
+
+        batch = BatchReply(timestamp) if timestamp else None
+        items = [(message, batch) for message in data]
+        if batch is not None:
+            items.append((None, batch))
+        self.inbound.extendleft(reversed(items))
+
+    def on_leave(self, data, timestamp=None):
+        channel = data.get('channel', None) if isinstance(data, dict) \
+            else None
+        if not isinstance(channel, str):
+            channel = None
+        self.leave(channel)
+        if timestamp:
+            self.write_message({'event': 'meteor/leave', 'timestamp': timestamp,
+                'data': {'channel': channel}})
+
+    def _discard(self, index, key):
+        connections = index.get(key, None)
+        if connections is not None:
+            connections.discard(self)
+            if not connections:
+                del index[key]
+
+    @classmethod
+    def recipients(cls, channels=None, users=None, exclude=None):
+        '''
+        Returns connections matching broadcast criteria. Without channels and
+        users it is all the connections. Cost is proportional to the size of
+        the selected channels, not to the count of all connections.
+        '''
+
+        if channels is None and users is None:
+            result = Connection.users
+        else:
+            result = set()
+            for index, keys in ((Connection.channels, channels),
+                    (Connection.presence.connections, users)):
+                if keys is None:
+                    continue
+                if not isinstance(keys, (list, tuple, set, frozenset)):
+                    keys = (keys, )
+                if index is Connection.presence.connections:
+                    keys = [cls.presence_key(user) for user in keys]
+                for key in keys:
+                    result.update(index.get(key, ()))
+
+        if exclude is not None:
+            return [c for c in result if c is not exclude]
+        return tuple(result)
+
+    @classmethod
+    def broadcast_presence(cls, joined, left):
+        ''' Presence listener which broadcasts batched joins and leaves '''
+
+        cls.deliver({
+            'event': 'meteor/presence',
+            'data': {'joined': joined, 'left': left}
+        }, critical=False)
+
+    def write_message(self, message, critical=True):
+        written = self.push(OutboundMessage(message), critical)
+        # any JSON serializable message may be written, not only events
+        event = message.get('event', None) if isinstance(message, dict) \
+            else None
+        Connection.metrics.event(event).bytes_out += written
+
+    def broadcast(self, event, data, channels=None, users=None, exclude=None,
+            critical=True, **kwargs):
         message = {'event': event, 'data': data}
         message.update(kwargs)
-        for user in self.users:
-            user.write_message(message)
 
+        report = self.deliver(message, channels, users, exclude, critical)
+
+        # sibling processes deliver broadcast to their own connections
+        report['forwarded'] = 0
+        bus = getattr(self.application, 'bus', None)
+        if bus is not None:
+            try:
+                report['forwarded'] = bus.publish({
+                    'message': message,
+                    'channels': channels,
+                    'users': users,
+                    'critical': critical
+                })
+            except Exception:
+                logging.exception('Broadcast "{0}" was not forwarded' \
+                    .format(event))
+        return report
+
+    @classmethod
+    def deliver(cls, message, channels=None, users=None, exclude=None,
+            critical=True):
+        ''' Writes message to the matching connections of this process '''
+
+        start = time.time()
+        cls.history.record(message, channels)
+
+        # encode and frame message once for all recipients
+        outbound = OutboundMessage(message)
+        recipients = sent = 0
+        for user in cls.recipients(channels, users, exclude):
+            written = user.push(outbound, critical)
+            if written:
+                recipients += 1
+                sent += written
+
+        cls.metrics.event(message.get('event', None)).bytes_out += sent
+
+        report = {
+            'event': message.get('event', None),
+            'recipients': recipients,
+            'bytes': sent,
+            'time': time.time() - start
+        }
+        logging.debug('Broadcast "{0}": {1} recipients, {2} bytes, {3:.2f} ms' \
+            .format(report['event'], recipients, sent, report['time'] * 1000))
+        return report
+
+    @classmethod
+    def stats_snapshot(cls):
+        ''' Dispatch metrics and counters of all the connections '''
+
+        snapshot = cls.metrics.snapshot()
+        snapshot.update({
+            'connections': len(Connection.users),
+            'users': Connection.presence.users_count,
+            'channels': len(Connection.channels),
+            'transports': dict(Connection.transports),
+            'rejected': dict(Connection.rejected_totals)
+        })
+        return snapshot
+
+
+class WSConnection(Connection, tornado.websocket.WebSocketHandler):
+    transport = 'websocket'
+
+    # default values of the "websocket" config section
+    default_options = dict(Connection.default_options, **{
+        'coalesce': False,
+        'coalesce_delay': 0,
+        'slow_consumer_policy': 'drop_oldest',
+        'compact_protocol': False,
+        'compression': False,
+        'compression_min_size': 1024,
+        'compression_level': 6,
+        'compression_mem_level': 8,
+        'compression_context_takeover': False,
+        'presence_events': False,
+        'heartbeat_interval': 0,
+        'heartbeat_tick': 1.0,
+        'idle_timeout': 0,
+        'stats_url': None
+    })
+
+    # compression counters of all the connections
+    compression_totals = {'messages': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    # on overflow of the outbound queue "drop_oldest" drops the oldest
+    # messages, "drop_noncritical" drops the oldest non-critical ones and
+    # disconnects if queue is still overflowed (only critical messages are
+    # queued), "disconnect" closes the connection at once
+    slow_consumer_policies = ('drop_oldest', 'drop_noncritical', 'disconnect')
+
+    def __init__(self, *args, **kwargs):
+        super(WSConnection, self).__init__(*args, **kwargs)
+        self.options = dict(self.default_options,
+            **self.settings.get('websocket', {}))
+        self.compact = False
+        self.heartbeat = None
+        self.ping_sent = None
+        self.rtt = None
+        self.deflater = None
+        self.deflate_wbits = self.inflate_wbits = zlib.MAX_WBITS
+        self.compressor = self.decompressor = None
+        self.compression_counters = {
+            'messages': 0, 'bytes_in': 0, 'bytes_out': 0
+        }
+        self.outbound = collections.deque()
+        self.outbound_bytes = 0
+        self.draining = False
+        self.outbound_stats = {
+            'queued': 0, 'max_queued_bytes': 0, 'dropped': 0,
+            'dropped_bytes': 0, 'frames': 0, 'bytes': 0, 'disconnected': False
+        }
+        self.init_connection()
+
+    @classmethod
+    def check_options(cls, options):
+        policy = options.get('slow_consumer_policy',
+            cls.default_options['slow_consumer_policy'])
+        if not policy in cls.slow_consumer_policies:
+            raise ConfigurationError.option_value_exc('websocket',
+                'slow_consumer_policy', policy, cls.slow_consumer_policies)
+
+    def select_subprotocol(self, subprotocols):
+        # compact binary protocol is used only if client asks for it
+        if self.options['compact_protocol'] and \
+            COMPACT_SUBPROTOCOL in subprotocols:
+                self.compact = True
+                return COMPACT_SUBPROTOCOL
+
+    def get_compression_options(self):
+        if self.options['compression']:
+            return {
+                'compression_level': self.options['compression_level'],
+                'mem_level': self.options['compression_mem_level']
+            }
+
+    def open(self):
+        self.read_deflate_state()
+
+        if self.compact:
+            # send event table, events are referenced by index + 1 later
+            self.write_frame(OutboundMessage({
+                'event': 'meteor/protocol',
+                'data': {
+                    'protocol': COMPACT_SUBPROTOCOL,
+                    'events': self.application.router.event_names
+                }
+            }).frame)
+
+        self.register()
+
+        self.last_activity = time.time()
+        if self.options['heartbeat_interval']:
+            self.schedule_heartbeat()
+
+    def schedule_heartbeat(self):
+        self.heartbeat = self.schedule(self.options['heartbeat_interval'],
+            self.on_heartbeat, self.options['heartbeat_tick'])
+
+    def on_heartbeat(self):
+        '''
+        Pings the client or reaps the connection if nothing was received from
+        the client during "idle_timeout" seconds
+        '''
+
+        self.heartbeat = None
+        if self.ws_connection is None or self.ws_connection.is_closing():
+            return
+
+        idle_timeout = self.options['idle_timeout'] or \
+            self.options['heartbeat_interval'] * 3
+        if time.time() - self.last_activity > idle_timeout:
+            logging.debug('Idle connection reaped')
+            self.unregister()
+            self.close(1001, 'Idle timeout')
+            return
+
+        self.ping_sent = time.time()
+        self.ping(b'meteor')
+        self.schedule_heartbeat()
+
+    def on_pong(self, data):
+        self.last_activity = time.time()
+        if self.ping_sent is not None:
+            self.rtt = self.last_activity - self.ping_sent
+            self.ping_sent = None
+
+    def on_close(self):
+        self.unregister()
+        self.outbound.clear()
+        self.outbound_bytes = 0
+        self.inbound.clear()
+
+    def unregister(self):
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+            self.heartbeat = None
+        super(WSConnection, self).unregister()
+
+    def push(self, message, critical=True):
+        '''
+        Sends OutboundMessage instance. Message is queued while the previous
+        write is not flushed to the socket yet, queue size is bounded by
+        "max_buffer_size" option and "slow_consumer_policy" decides what to do
+        on overflow. In coalescing mode all the queued messages are flushed as
+        single array frame once per IOLoop iteration or after "coalesce_delay"
+        microseconds. Returns count of bytes sent or queued, 0 if message was
+        dropped or connection was closed.
+        '''
+
+        if self.ws_connection is None or self.ws_connection.is_closing():
+            return 0
+
+        coalesce = self.options['coalesce']
+        if not coalesce and not self.outbound and \
+            not self.ws_connection.stream.writing():
+                return self.write_frame(self.framed(message))
+
+        if coalesce and not self.outbound:
+            io_loop = tornado.ioloop.IOLoop.current()
+            delay = self.options['coalesce_delay']
+            if delay:
+                io_loop.add_timeout(io_loop.time() + delay / 1000000.0,
+                    self.flush_outbound)
+            else:
+                io_loop.add_callback(self.flush_outbound)
+
+        size = len(self.encoded(message))
+        entry = (message, critical)
+        self.outbound.append(entry)
+        self.outbound_bytes += size
+        self.outbound_stats['queued'] += 1
+        if not coalesce:
+            self.wait_drain()
+        if self.outbound_bytes > self.options['max_buffer_size']:
+            self.on_overflow()
+        self.outbound_stats['max_queued_bytes'] = max(
+            self.outbound_stats['max_queued_bytes'], self.outbound_bytes)
+        # dropped messages are only removed, so queued one is still the last
+        if not self.outbound or self.outbound[-1] is not entry:
+            return 0
+        return size
+
+    def on_overflow(self):
+        ''' Applies slow consumer policy to the overflowed outbound queue '''
+
+        policy = self.options['slow_consumer_policy']
+        limit = self.options['max_buffer_size']
+
+        if policy == 'drop_oldest':
+            while self.outbound and self.outbound_bytes > limit:
+                self._drop(0)
+        elif policy == 'drop_noncritical':
+            index = 0
+            while index < len(self.outbound) and self.outbound_bytes > limit:
+                if self.outbound[index][1]:
+                    index += 1
+                else:
+                    self._drop(index)
+
+        if self.outbound_bytes > limit:
+            logging.warning('Slow consumer disconnected: {0} bytes queued' \
+                .format(self.outbound_bytes))
+            self.outbound_stats['disconnected'] = True
+            self.outbound.clear()
+            self.outbound_bytes = 0
+            self.close(1008, 'Slow consumer')
+
+    def _drop(self, index):
+        message, critical = self.outbound[index]
+        del self.outbound[index]
+        size = len(self.encoded(message))
+        self.outbound_bytes -= size
+        self.outbound_stats['dropped'] += 1
+        self.outbound_stats['dropped_bytes'] += size
 
-class View(tornado.web.RequestHandler):
     @property
-    def package(self):
-        return self.application.package_manager.get_package(self.__class__).name
+    def queue_stats(self):
+        ''' Outbound queue depth and counters of this connection '''
+
+        stats = dict(self.outbound_stats)
+        stats.update({
+            'depth': len(self.outbound),
+            'depth_bytes': self.outbound_bytes,
+            'limit_bytes': self.options['max_buffer_size'],
+            'policy': self.options['slow_consumer_policy']
+        })
+        return stats
+
+    def flush_outbound(self):
+        if not self.outbound or self.ws_connection is None:
+            return
+        if self.ws_connection.stream.writing():
+            # will be flushed as soon as the previous write is done
+            self.wait_drain()
+            return
+
+        messages = [message for message, critical in self.outbound]
+        self.outbound.clear()
+        self.outbound_bytes = 0
+
+        if self.options['coalesce'] and len(messages) > 1:
+            payloads = [self.encoded(m) for m in messages]
+            if self.compact:
+                frame = self.make_frame(encode_batch(payloads), OPCODE_BINARY)
+            else:
+                frame = self.make_frame(b'[' + b','.join(payloads) + b']')
+        else:
+            frame = b''.join(self.framed(m) for m in messages)
+        self.write_frame(frame)
+
+    def encoded(self, message):
+        ''' Returns OutboundMessage payload in the connection protocol '''
+
+        if self.compact:
+            return message.compact(self.application.router.event_ids)
+        return message.text
+
+    def framed(self, message):
+        ''' Returns OutboundMessage frame in the connection protocol '''
+
+        if self.compresses(self.encoded(message)):
+            if not self.shared_compression:
+                return self.make_frame(self.encoded(message),
+                    OPCODE_BINARY if self.compact else OPCODE_TEXT)
+
+            # compressed by fresh compressor, so frame is the same for all
+            # connections with the same settings
+            opts = self.options
+            payload = self.encoded(message)
+            frame = message.deflated_frame(payload,
+                OPCODE_BINARY if self.compact else OPCODE_TEXT,
+                opts['compression_level'], self.deflate_wbits,
+                opts['compression_mem_level'])
+            self._count_compression(len(payload), len(frame))
+            return frame
+
+        if self.compact:
+            return message.compact_frame(self.application.router.event_ids)
+        return message.frame
+
+    def make_frame(self, payload, opcode=OPCODE_TEXT):
+        ''' Builds frame of the payload compressing it if needed '''
+
+        if not self.compresses(payload):
+            return make_frame(payload, opcode)
+
+        opts = self.options
+        compressor = None if self.shared_compression else self.compressor
+        frame = make_frame(deflate(payload, opts['compression_level'],
+            self.deflate_wbits, opts['compression_mem_level'],
+            compressor), opcode, FLAG_DEFLATE)
+        self._count_compression(len(payload), len(frame))
+        return frame
+
+    def compresses(self, payload):
+        return self.deflater is not None and \
+            len(payload) >= self.options['compression_min_size']
+
+    @property
+    def shared_compression(self):
+        '''
+        True if messages are compressed without context takeover. Such frames
+        are compressed once per broadcast instead of once per connection.
+        '''
+
+        return not self.options['compression_context_takeover'] or \
+            self.compressor is None
+
+    def read_deflate_state(self):
+        '''
+        Reads permessage-deflate state of the tornado connection once it is
+        open: compressor (None if extension was not negotiated), window bits
+        and persistent zlib objects. These are private attributes of
+        tornado.websocket, missing ones are taken as defaults.
+        '''
+
+        deflater = getattr(self.ws_connection, '_compressor', None)
+        inflater = getattr(self.ws_connection, '_decompressor', None)
+        self.deflater = deflater
+        self.deflate_wbits = getattr(deflater, '_max_wbits', zlib.MAX_WBITS)
+        self.inflate_wbits = getattr(inflater, '_max_wbits', zlib.MAX_WBITS)
+        self.compressor = getattr(deflater, '_compressor', None)
+        self.decompressor = getattr(inflater, '_decompressor', None)
+
+    def _count_compression(self, size_in, size_out):
+        for counters in (self.compression_counters,
+                WSConnection.compression_totals):
+            counters['messages'] += 1
+            counters['bytes_in'] += size_in
+            counters['bytes_out'] += size_out
+
+    @property
+    def compression_stats(self):
+        '''
+        Compression counters and approximate zlib memory of this connection
+        '''
+
+        stats = dict(self.compression_counters)
+        stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+        stats['enabled'] = self.deflater is not None
+        stats['memory'] = 0
+        # persistent zlib objects are allocated by tornado if client did not
+        # ask for "no context takeover", whatever the options are
+        if self.compressor is not None:
+            stats['memory'] += deflate_memory(self.deflate_wbits,
+                self.options['compression_mem_level'])
+        if self.decompressor is not None:
+            stats['memory'] += inflate_memory(self.inflate_wbits)
+        return stats
+
+    def write_frame(self, frame):
+        ''' Writes prepared websocket frame. Returns count of bytes written '''
+
+        if not self.ws_connection or self.ws_connection.is_closing():
+            return 0
+        try:
+            future = self.ws_connection.stream.write(frame)
+        except tornado.iostream.StreamClosedError:
+            return 0
+        self.outbound_stats['frames'] += 1
+        self.outbound_stats['bytes'] += len(frame)
+        if future is not None:
+            future.add_done_callback(self._on_frame_written)
+        return len(frame)
+
+    def _on_frame_written(self, future):
+        # connection may be lost before frame is flushed
+        if future.exception() is None and self.outbound:
+            self.flush_outbound()
+
+    def wait_drain(self):
+        '''
+        Flushes the queue when the stream is drained. Stream may be busy with
+        data written by tornado itself (handshake, ping or pong), which does
+        not call "_on_frame_written".
+        '''
+
+        if self.draining or self.ws_connection is None:
+            return
+        try:
+            # empty write is resolved when all the buffered data is written
+            future = self.ws_connection.stream.write(b'')
+        except tornado.iostream.StreamClosedError:
+            return
+        self.draining = True
+        future.add_done_callback(self._on_drained)
+
+    def _on_drained(self, future):
+        self.draining = False
+        self._on_frame_written(future)
+
+    @classmethod
+    def stats_snapshot(cls):
+        snapshot = super(WSConnection, cls).stats_snapshot()
+        snapshot['compression'] = dict(WSConnection.compression_totals)
+        return snapshot
+
+
+class BatchReply(object):
+    ''' Answers of the batch events collected for combined reply '''
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.answers = {}
+
+
+class View(tornado.web.RequestHandler):
+    # name of the package, resolved at startup by PackagesManager
+    package = None
+
+    # page wrapper template and its rendered head and tail fragments
+    wrapper_path = os.path.realpath(os.path.join(
+        os.path.dirname(__file__), 'template', 'view.html'))
+    wrapper_cache = {}
+    wrapper_cache_size = 256
+
+    # global template filters merged with filters of the package, set by
+    # Router at startup
+    template_filters = filters.get_filters(filters)
+
+    # streaming views flush page head before the body is rendered
+    streaming = False
 
     def embedded_css(self):
         return ''
@@ -62,54 +890,113 @@ class View(tornado.web.RequestHandler):
         return ''
 
     def get_template_path(self):
+        return self.template_dir()
+
+    @classmethod
+    def template_dir(cls):
         return os.path.join(
-            os.path.dirname(sys.modules[self.__module__].__file__), 'templates')
+            os.path.dirname(sys.modules[cls.__module__].__file__), 'templates')
 
-    def prepare(self):
-        for name, ref in self.application.databases.items():
-            setattr(self, name, ref)
+    def create_template_loader(self, template_path):
+        # loaders of templates compiled at startup
+        loaders = getattr(self.application, 'template_loaders', {})
+        if template_path in loaders:
+            return loaders[template_path]
+        return super(View, self).create_template_loader(template_path)
 
     def render_string(self, *args, **kwargs):
-        # add template filters
-        global_filters = {}
-        for name, obj in inspect.getmembers(filters):
-            if isinstance(obj, filters.TemplateFilter):
-                global_filters[name] = obj
-
-        # TODO: add custom filters
-        kwargs.update(global_filters)
+        kwargs.update(self.template_filters)
         return super(View, self).render_string(*args, **kwargs)
 
     def render_view(self, template_name, **kwargs):
-        wrapper_path = os.path.realpath(os.path.join(
-            os.path.dirname(sys.modules['meteor'].__file__),
-            'template', 'view.html'
-        ))
-
-        metadata = self.application.views_metadata.copy()
-        metadata.update(self.metadata())
-        metadata.update({
-            'embedded_css': self.embedded_css(),
-            'embedded_js': self.embedded_js(),
-            'scripts':
-                self.application.static_manager.get_chain('js', self.package),
-            'css':
-                self.application.static_manager.get_chain('css', self.package),
-            'minified': self.settings['use_compressed_static']
-        })
+        if self.streaming:
+            # response is finished by "stream_view" even if the view does
+            # not return its result
+            self._auto_finish = False
+            return self.stream_view(template_name, **kwargs)
+        head, tail = self.get_wrapper()
+        self.finish(head + self.render_string(template_name, **kwargs) + tail)
+
+    @tornado.gen.coroutine
+    def stream_view(self, template_name, **kwargs):
+        '''
+        Flushes page head at once, so the browser loads scripts and styles
+        while the body is prepared. Template arguments may be Futures (e.g.
+        result of "fetch_async"), body is rendered when all of them are
+        resolved and written with the page tail. Errors are logged, as the
+        status is already sent when they happen.
+        '''
+
+        head, tail = self.get_wrapper()
+        try:
+            self.write(head)
+            yield self.flush()
+
+            futures = {k: v for k, v in kwargs.items() if is_future(v)}
+            if futures:
+                kwargs.update((yield futures))
+            self.finish(self.render_string(template_name, **kwargs) + tail)
+        except tornado.iostream.StreamClosedError:
+            # client has gone
+            pass
+        except Exception:
+            self.log_exception(*sys.exc_info())
+            if not self._finished:
+                self.finish()
 
-        wrapper = self.render_string(wrapper_path, **metadata)
+    def get_wrapper(self):
+        '''
+        Returns page wrapper rendered and split around the body. Wrapper is
+        rendered once per package, static mode, locale and view metadata. In
+        debug mode it is rendered on each request, as static versions it
+        refers to may change.
+        '''
 
-        body_index = wrapper.rindex(tornado.util.b('</body>'))
-        html = wrapper[:body_index] + \
-            self.render_string(template_name, **kwargs) + wrapper[body_index:]
-        self.finish(html)
+        embedded_css, embedded_js = self.embedded_css(), self.embedded_js()
+        metadata = self.metadata()
+        if self.settings.get('debug', False):
+            return self.render_wrapper(embedded_css, embedded_js, metadata)
+
+        key = (self.package, self.settings['use_compressed_static'],
+            self.locale.code, embedded_css, embedded_js,
+            repr(sorted(metadata.items())))
+
+        wrapper = View.wrapper_cache.get(key, None)
+        if wrapper is None:
+            wrapper = self.render_wrapper(embedded_css, embedded_js, metadata)
+            if len(View.wrapper_cache) >= self.wrapper_cache_size:
+                View.wrapper_cache.clear()
+            View.wrapper_cache[key] = wrapper
+        return wrapper
+
+    def render_wrapper(self, embedded_css, embedded_js, metadata):
+        page_metadata = self.application.views_metadata.copy()
+        page_metadata.update(metadata)
+        page_metadata.update({
+            'embedded_css': embedded_css,
+            'embedded_js': embedded_js,
+            'scripts': self.application.static_manager.get_chain('js',
+                self.package, self.settings['use_compressed_static']),
+            'css': self.application.static_manager.get_chain('css',
+                self.package, self.settings['use_compressed_static']),
+            'minified': self.settings['use_compressed_static']
+        })
+        html = self.render_string(self.wrapper_path, **page_metadata)
+        body_index = html.rindex(b'</body>')
+        return html[:body_index], html[body_index:]
 
     def metadata(self):
         return {}
 
 
 class EventHandler(object):
+    '''
+    Handles one incoming event. "handling" method may be a coroutine (or
+    return a Future) - in this case connection waits for it before the next
+    message is dispatched and the handler keeps its connection and timestamp,
+    so "answer" and "send" may be called after any "yield" or "await".
+    '''
+
     @property
     def current_user(self):
         return self.get_current_user() or self.connection.current_user
@@ -117,34 +1004,86 @@ class EventHandler(object):
     def get_current_user(self):
         return None
 
-    def __init__(self, connection):
+    # name of the package, resolved at startup by PackagesManager
+    package = None
+
+    # "package/event" name, resolved at startup by Router
+    event_fullname = None
+
+    # rate limit of the event per connection: messages per second and burst
+    rate_limit = None
+    rate_burst = None
+
+    # pooled handlers are reused instead of being instantiated per message,
+    # at most "pool_size" idle instances are kept. Pooled handler must not
+    # keep any state between events
+    pooled = False
+    pool_size = 8
+
+    # count of recent broadcasts of the event kept in Connection.history,
+    # ring is filled by "history_backfill" at startup
+    history_size = 0
+
+    def __init__(self, connection, timestamp=None, batch=None):
+        self.bind(connection, timestamp, batch)
+
+    def bind(self, connection, timestamp=None, batch=None):
         self.connection = connection
-        self.application = connection.application
-        # TODO: add more references
+        self.application = connection.application if connection else None
+        self.timestamp = timestamp
+        self.batch = batch
 
-    @property
-    def package(self):
-        return self.application.package_manager.get_package(
-            self.__class__, 'handlers').name
+    @classmethod
+    def get_pool(cls):
+        # each class has own pool, inherited one must not be shared
+        if not '_pool' in cls.__dict__:
+            cls._pool = []
+        return cls._pool
 
-    @property
-    def event_fullname(self):
-        return '/'.join([self.package, self.event])
+    @classmethod
+    def acquire(cls, connection, timestamp=None, batch=None):
+        pool = cls.get_pool() if cls.pooled else None
+        if pool:
+            handler = pool.pop()
+            handler.bind(connection, timestamp, batch)
+            return handler
+        return cls(connection, timestamp, batch)
+
+    @classmethod
+    def release(cls, handler):
+        if cls.pooled and len(cls.get_pool()) < cls.pool_size:
+            handler.bind(None)
+            cls.get_pool().append(handler)
+
+    @classmethod
+    def history_backfill(cls):
+        ''' Override to return data of recent events (oldest first) '''
+        return []
 
     def prepare(self):
-        for name, ref in self.application.databases.items():
-            setattr(self, name, ref)
+        pass
 
-    def send(self, event, data, **kwargs):
+    def send(self, event, data, critical=True, **kwargs):
         message = {'event': event, 'data': data}
         message.update(kwargs)
-        self.connection.write_message(message)
+        self.connection.write_message(message, critical)
 
     def answer(self, data, **kwargs):
+        if self.batch is not None and self.timestamp:
+            # sent later within combined reply of the batch
+            self.batch.answers[self.timestamp] = data
+            return
         if self.timestamp:
             kwargs.update({'timestamp': self.timestamp})
         self.send(self.event_fullname, data, **kwargs)
 
-    def broadcast(self, event, data, **kwargs):
-        # TODO: add criteria
-        self.connection.broadcast(event, data, **kwargs)
+    def broadcast(self, event, data, channels=None, users=None, exclude=None,
+            critical=True, **kwargs):
+        return self.connection.broadcast(event, data, channels=channels,
+            users=users, exclude=exclude, critical=critical, **kwargs)
+
+    def join(self, *channels):
+        self.connection.join(*channels)
+
+    def leave(self, *channels):
+        self.connection.leave(*channels)
@@ -0,0 +1,27 @@
+import time
+
+
+class TokenBucket(object):
+    '''
+    Token bucket rate limiter. Bucket holds up to "burst" tokens and is
+    refilled by "rate" tokens per second. Each allowed action consumes tokens
+    '''
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def consume(self, tokens=1):
+        ''' Returns True if action is allowed, False if limit is exceeded '''
+
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+            self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
@@ -0,0 +1,74 @@
+import logging
+
+import tornado.ioloop
+
+
+class Timer(object):
+    def __init__(self, callback, slot, rounds):
+        self.callback = callback
+        self.slot = slot
+        self.rounds = rounds
+
+    def cancel(self):
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+        # timer may be cancelled by another callback of the same tick
+        self.callback = None
+
+
+class TimerWheel(object):
+    '''
+    Hashed timer wheel. All the timers are driven by single periodic
+    callback, so scheduling and cancelling cost O(1) however many timers
+    exist. Timers fire with "tick" seconds precision.
+    '''
+
+    def __init__(self, tick=1.0, size=512):
+        self.tick = tick
+        self.slots = [set() for i in range(size)]
+        self.position = 0
+        self.periodic = None
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.slots)
+
+    def schedule(self, delay, callback):
+        ''' Calls callback after delay seconds. Returns Timer instance '''
+
+        if self.periodic is None:
+            self.periodic = tornado.ioloop.PeriodicCallback(self.advance,
+                self.tick * 1000)
+            self.periodic.start()
+
+        ticks = max(1, int(round(delay / self.tick)))
+        slot = self.slots[(self.position + ticks) % len(self.slots)]
+        timer = Timer(callback, slot, (ticks - 1) // len(self.slots))
+        slot.add(timer)
+        return timer
+
+    def advance(self):
+        self.position = (self.position + 1) % len(self.slots)
+        slot = self.slots[self.position]
+
+        # expired timers leave the slot before any callback is run, so
+        # callbacks may schedule and cancel timers freely
+        expired = [timer for timer in slot if not timer.rounds]
+        slot.difference_update(expired)
+        for timer in slot:
+            timer.rounds -= 1
+        for timer in expired:
+            timer.slot = None
+        for timer in expired:
+            callback, timer.callback = timer.callback, None
+            if callback is None:
+                continue
+            try:
+                callback()
+            except Exception:
+                logging.exception('Timer callback failed')
+
+    def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
@@ -0,0 +1,47 @@
+import collections
+
+
+class History(object):
+    '''
+    Bounded rings of recent broadcasts keyed by event name or channel. Only
+    declared keys are recorded (see "track"), old messages are dropped as new
+    ones come, so memory does not grow with count of broadcasts.
+
+    Every process records broadcasts forwarded by the bus too, so the history
+    is complete in each of them.
+    '''
+
+    def __init__(self):
+        self.rings = {}
+
+    def track(self, key, size, backfill=()):
+        '''
+        Starts recording broadcasts of the event or channel. Backfill messages
+        (oldest first) are placed before already recorded ones.
+        '''
+
+        recorded = self.rings.get(key, ())
+        self.rings[key] = collections.deque(backfill, maxlen=size)
+        self.rings[key].extend(recorded)
+
+    def untrack(self, key):
+        self.rings.pop(key, None)
+
+    def record(self, message, channels=None):
+        ring = self.rings.get(message.get('event', None), None)
+        if ring is not None:
+            ring.append(message)
+
+        if channels is not None:
+            if not isinstance(channels, (list, tuple, set, frozenset)):
+                channels = (channels, )
+            for channel in channels:
+                ring = self.rings.get(channel, None)
+                if ring is not None:
+                    ring.append(message)
+
+    def recent(self, key, limit=None):
+        ''' Returns list of recent messages of the key, oldest first '''
+
+        messages = list(self.rings.get(key, ()))
+        return messages[-limit:] if limit else messages
@@ -0,0 +1,110 @@
+import bisect
+
+import tornado.web
+
+
+class Histogram(object):
+    '''
+    Histogram with fixed buckets. Adding value costs one binary search over
+    bucket bounds and memory does not grow with count of values.
+    '''
+
+    # upper bounds of buckets in seconds, last bucket is unbounded
+    bounds = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+        0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, percent):
+        ''' Returns upper bound of the bucket containing percentile '''
+
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': [[bound, count] for bound, count in
+                zip(self.bounds + (None, ), self.counts)],
+            'p50': self.percentile(50),
+            'p99': self.percentile(99)
+        }
+
+
+class EventMetrics(object):
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.decode_time = 0.0
+        self.bytes_out = 0
+        self.latency = Histogram()
+
+    def received(self, decode_time):
+        self.count += 1
+        self.decode_time += decode_time
+
+    def handled(self, latency, failed=False):
+        self.latency.add(latency)
+        if failed:
+            self.errors += 1
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'decode_time': self.decode_time,
+            'bytes_out': self.bytes_out,
+            'latency': self.latency.snapshot()
+        }
+
+
+class Metrics(object):
+    ''' Dispatch metrics of the process grouped by event name '''
+
+    def __init__(self):
+        self.events = {}
+        self.decode = Histogram()
+
+    def event(self, name):
+        if not name in self.events:
+            self.events[name] = EventMetrics()
+        return self.events[name]
+
+    def snapshot(self):
+        return {
+            'decode': self.decode.snapshot(),
+            'events': {k: v.snapshot() for k, v in self.events.items()}
+        }
+
+
+class StatsView(tornado.web.RequestHandler):
+    '''
+    Read-only JSON view of the websocket statistics. Only local requests are
+    allowed by default, override "check_access" to change it.
+    '''
+
+    local_addresses = ('127.0.0.1', '::1')
+
+    def check_access(self):
+        return self.request.remote_ip in self.local_addresses
+
+    def get(self):
+        if not self.check_access():
+            raise tornado.web.HTTPError(403)
+        self.write(self.application.ws_connection.stats_snapshot())
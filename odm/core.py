@@ -1,6 +1,8 @@
 import sys
 import inspect
 
+from concurrent.futures import ThreadPoolExecutor
+
 from pymongo.connection import Connection
 from pymongo.son_manipulator import SONManipulator
 from pymongo.objectid import ObjectId
@@ -81,6 +83,8 @@ class Database(object):
     quiet_output - to hide warning. False by default
     safe_mode - to set safe quering mode. May be bool or dict (safe options).
     False by default
+    max_workers - size of the thread pool which runs asynchronous queries
+    (fetch_async, count_async, save_async etc). 4 by default
 
     To see full database info just type
     >>> db = Database(name, host, port)
@@ -100,7 +104,8 @@ class Database(object):
         return self._port
 
     def __init__(self, db_name='test', host='127.0.0.1', port=27017,
-            gen_ids=True, quiet_output=False, safe_mode=False, schemes=()):
+            gen_ids=True, quiet_output=False, safe_mode=False, schemes=(),
+            max_workers=4):
 
         # set quiet output if need
         Selector.quiet_output = quiet_output
@@ -120,6 +125,9 @@ class Database(object):
         # connect to mongo
         self._connection = Connection(host, port)[db_name]
 
+        # create bounded pool for asynchronous queries
+        self.executor = ThreadPoolExecutor(max_workers)
+
         # add converter
         self._connection.add_son_manipulator(ConvertToObject(self))
 
@@ -260,11 +268,21 @@ class Document(object, metaclass=DocumentMeta):
     def count(self):
         pass
 
+    @odmclassmethod
+    @query_method
+    def count_async(self):
+        pass
+
     @odmclassmethod
     @query_method
     def create(self, *args, **kwargs):
         pass
 
+    @odmclassmethod
+    @query_method
+    def create_async(self, *args, **kwargs):
+        pass
+
     @odmclassmethod
     @query_method
     def filter(self, *args, **kwargs):
@@ -280,6 +298,12 @@ class Document(object, metaclass=DocumentMeta):
             raise # TODO: make expression - instance must have _id attr
         return Query(self).filter(_id = self._id).remove(safe__=safe__)
 
+    def remove_async(self, safe__=None):
+        return Query.run_async(self.__class__, self.remove, safe__)
+
+    def save_async(self, safe=None, drop_null=True):
+        return Query.run_async(self.__class__, self.save, safe, drop_null)
+
     def save(self, safe=None, drop_null=True):
         doc = {k:v for k,v in self.__dict__.items() if v} if drop_null \
             else self.__dict__.copy()
@@ -1,5 +1,8 @@
+import functools
 import logging
 
+import tornado.ioloop
+
 from .selectors import Selector, ConditionalSelector
 from .modifiers import Modifier, set_
 from ..helpers.dictonaries import extend
@@ -156,6 +159,18 @@ class Query(object):
             .replace('True', 'true').replace('False', 'false')
 
 
+    @staticmethod
+    def run_async(scheme, fn, *args, **kwargs):
+        '''
+        Runs blocking function on the thread pool of scheme database.
+        Returns Future resolved on the current IOLoop (result is passed from
+        the pool thread to the IOLoop thread safely).
+        '''
+
+        return tornado.ioloop.IOLoop.current().run_in_executor(
+            scheme._meta.db_ref.executor,
+            functools.partial(fn, *args, **kwargs))
+
     def _extend_query(self, method, args={}, prepare_fn=lambda x: x):
         self.methods.append(method)
         self.args.append(args)
@@ -169,6 +184,12 @@ class Query(object):
         self._extend_query(method='count')
         return self.cursor
 
+    def count_async(self):
+        return self.run_async(self.scheme, self.count)
+
+    def fetch_async(self, cast_to=object):
+        return self.run_async(self.scheme, self.fetch, cast_to)
+
     def fetch(self, cast_to=object):
         if getattr(self, '_is_empty', False):
             return tuple()
@@ -378,6 +399,15 @@ class Query(object):
             instance._id = _id
         return instance
 
+    def create_async(self, *args, **kwargs):
+        return self.run_async(self.scheme, self.create, *args, **kwargs)
+
+    def update_async(self, *args, **kwargs):
+        return self.run_async(self.scheme, self.update, *args, **kwargs)
+
+    def remove_async(self, *args, **kwargs):
+        return self.run_async(self.scheme, self.remove, *args, **kwargs)
+
     def refresh(self):
         self.cursor._rewind()
         self.cursor._refresh()
@@ -6,6 +6,7 @@ import sys
 from .handlers import EventHandler, View
 from .forms import Form
 from .odm.core import DocumentMeta, Document
+from .template.filters import get_filters
 
 
 class Package(object):
@@ -18,6 +19,7 @@ class Package(object):
         self.views = []
         self.handlers = []
         self.forms = []
+        self.filters = {}
 
         # TODO: rewrite try/except to os.path.exists cause ImportError may be
         # in module
@@ -50,6 +52,13 @@ class Package(object):
         except ImportError:
             pass
 
+        try:
+            # gather template filters
+            filters = importlib.import_module('.filters', module.__package__)
+            self.filters = get_filters(filters)
+        except ImportError:
+            pass
+
         try:
             # gather forms
             forms = importlib.import_module('.forms', module.__package__)
@@ -91,6 +100,20 @@ class PackagesManager(object):
             items.extend(getattr(package, name, []))
         return items
 
+    def resolve_packages(self):
+        '''
+        Assigns package name to each view and event handler class once at
+        startup. Class belongs to the first package it was found in.
+        '''
+
+        for name in ('views', 'handlers'):
+            resolved = set()
+            for package in self.packages:
+                for cls in getattr(package, name, []):
+                    if not cls in resolved:
+                        cls.package = package.name
+                        resolved.add(cls)
+
     def get_package(self, cls, name='views'):
         for package in self.packages:
             if cls in getattr(package, name, []):
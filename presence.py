@@ -0,0 +1,96 @@
+import tornado.ioloop
+
+
+class Presence(object):
+    '''
+    Registry of online users. Maps user key (see Connection.presence_key)
+    to the set of the user's live connections and keeps counters up to date,
+    so all the questions like "is user online" or "how many users are online"
+    are answered in constant time. Connections of anonymous users (key is
+    None) are counted separately.
+
+    Joins and leaves are batched: listeners subscribed by "subscribe" method
+    are called once per IOLoop iteration with lists of joined and left users.
+    User who left and joined again in the same iteration is not reported.
+    Registry knows connections of the current process only.
+    '''
+
+    def __init__(self):
+        self.connections = {}
+        self.connections_count = 0
+        self.anonymous = set()
+        self.listeners = []
+        self.joined = set()
+        self.left = set()
+
+    def add(self, user, connection):
+        ''' Registers connection. Returns True if user just came online '''
+
+        if user is None:
+            if not connection in self.anonymous:
+                self.anonymous.add(connection)
+                self.connections_count += 1
+            return False
+        self.connections_count += 1
+        if user in self.connections:
+            self.connections[user].add(connection)
+            return False
+        self.connections[user] = set([connection])
+        self._changed(user, self.joined, self.left)
+        return True
+
+    def remove(self, user, connection):
+        ''' Unregisters connection. Returns True if user went offline '''
+
+        if user is None:
+            if connection in self.anonymous:
+                self.anonymous.remove(connection)
+                self.connections_count -= 1
+            return False
+
+        connections = self.connections.get(user, None)
+        if connections is None or not connection in connections:
+            return False
+        self.connections_count -= 1
+        connections.remove(connection)
+        if connections:
+            return False
+        del self.connections[user]
+        self._changed(user, self.left, self.joined)
+        return True
+
+    def is_online(self, user):
+        return user in self.connections
+
+    def get_connections(self, user):
+        return self.connections.get(user, frozenset())
+
+    @property
+    def users_count(self):
+        return len(self.connections)
+
+    @property
+    def anonymous_count(self):
+        return len(self.anonymous)
+
+    def subscribe(self, callback):
+        ''' Callback takes lists of joined and left users '''
+        self.listeners.append(callback)
+
+    def _changed(self, user, changes, opposite):
+        if not self.listeners:
+            return
+        if user in opposite:
+            opposite.remove(user)
+        else:
+            if not self.joined and not self.left:
+                tornado.ioloop.IOLoop.current().add_callback(self.flush)
+            changes.add(user)
+
+    def flush(self):
+        joined, left = list(self.joined), list(self.left)
+        self.joined.clear()
+        self.left.clear()
+        if joined or left:
+            for callback in self.listeners:
+                callback(joined, left)
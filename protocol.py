@@ -0,0 +1,259 @@
+import struct
+import zlib
+
+from tornado.escape import json_encode, utf8
+
+from .exceptions import ProtocolError
+
+
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+
+# RSV1 bit marks compressed message of permessage-deflate extension
+FLAG_DEFLATE = 0x40
+
+# compact protocol: subprotocol name and value type tags
+COMPACT_SUBPROTOCOL = 'meteor.compact'
+
+TYPE_NONE, TYPE_FALSE, TYPE_TRUE, TYPE_INT8, TYPE_INT32, TYPE_FLOAT, \
+    TYPE_STR8, TYPE_STR32, TYPE_LIST, TYPE_DICT, TYPE_INT64 = range(11)
+
+# event id 0 means event name follows, last id marks batch of messages
+EVENT_BY_NAME = 0
+EVENT_BATCH = 0xFFFF
+
+
+def make_frame(data, opcode=OPCODE_TEXT, flags=0):
+    '''
+    Builds unmasked (server to client) websocket frame as described in
+    RFC 6455. Returned bytes may be written directly to the connection stream
+    '''
+
+    first_byte = 0x80 | flags | opcode
+    length = len(data)
+    if length < 126:
+        header = struct.pack('!BB', first_byte, length)
+    elif length <= 0xFFFF:
+        header = struct.pack('!BBH', first_byte, 126, length)
+    else:
+        header = struct.pack('!BBQ', first_byte, 127, length)
+    return header + data
+
+
+def deflate(data, level=6, wbits=zlib.MAX_WBITS, mem_level=8, compressor=None):
+    '''
+    Compresses message payload as described in RFC 7692. Without compressor
+    fresh one is used so result does not depend on any previous message
+    '''
+
+    compressor = compressor or \
+        zlib.compressobj(level, zlib.DEFLATED, -wbits, mem_level)
+    data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data[:-4]
+
+
+def deflate_memory(wbits=zlib.MAX_WBITS, mem_level=8):
+    ''' Approximate memory used by zlib compressor (see zconf.h) '''
+    return (1 << (wbits + 2)) + (1 << (mem_level + 9))
+
+
+def inflate_memory(wbits=zlib.MAX_WBITS):
+    ''' Approximate memory used by zlib decompressor (see zconf.h) '''
+    return (1 << wbits) + 7168
+
+
+def encode_value(value, chunks):
+    ''' Appends compact binary representation of JSON-like value to chunks '''
+
+    if value is None:
+        chunks.append(struct.pack('!B', TYPE_NONE))
+    elif value is True or value is False:
+        chunks.append(struct.pack('!B', TYPE_TRUE if value else TYPE_FALSE))
+    elif isinstance(value, int) and -0x80 <= value < 0x80:
+        chunks.append(struct.pack('!Bb', TYPE_INT8, value))
+    elif isinstance(value, int) and -0x80000000 <= value < 0x80000000:
+        chunks.append(struct.pack('!Bi', TYPE_INT32, value))
+    elif isinstance(value, int) and \
+        -0x8000000000000000 <= value < 0x8000000000000000:
+            chunks.append(struct.pack('!Bq', TYPE_INT64, value))
+    elif isinstance(value, (int, float)):
+        chunks.append(struct.pack('!Bd', TYPE_FLOAT, value))
+    elif isinstance(value, (str, bytes)):
+        value = utf8(value)
+        if len(value) <= 0xFF:
+            chunks.append(struct.pack('!BB', TYPE_STR8, len(value)))
+        else:
+            chunks.append(struct.pack('!BI', TYPE_STR32, len(value)))
+        chunks.append(value)
+    elif isinstance(value, (list, tuple)):
+        chunks.append(struct.pack('!BI', TYPE_LIST, len(value)))
+        for item in value:
+            encode_value(item, chunks)
+    elif isinstance(value, dict):
+        chunks.append(struct.pack('!BI', TYPE_DICT, len(value)))
+        for k, v in value.items():
+            encode_value(k if isinstance(k, str) else str(k), chunks)
+            encode_value(v, chunks)
+    else:
+        raise TypeError('{0} is not serializable by compact protocol' \
+            .format(repr(value)))
+
+
+def decode_value(data, offset=0):
+    ''' Returns decoded value and offset of the data following it '''
+
+    tag = data[offset]
+    offset += 1
+    if tag == TYPE_NONE:
+        return None, offset
+    elif tag in (TYPE_FALSE, TYPE_TRUE):
+        return tag == TYPE_TRUE, offset
+    elif tag == TYPE_INT8:
+        return struct.unpack_from('!b', data, offset)[0], offset + 1
+    elif tag == TYPE_INT32:
+        return struct.unpack_from('!i', data, offset)[0], offset + 4
+    elif tag == TYPE_INT64:
+        return struct.unpack_from('!q', data, offset)[0], offset + 8
+    elif tag == TYPE_FLOAT:
+        return struct.unpack_from('!d', data, offset)[0], offset + 8
+    elif tag in (TYPE_STR8, TYPE_STR32):
+        fmt, size = ('!B', 1) if tag == TYPE_STR8 else ('!I', 4)
+        length = struct.unpack_from(fmt, data, offset)[0]
+        offset += size
+        if offset + length > len(data):
+            raise ValueError('Compact protocol string is truncated')
+        return data[offset:offset + length].decode('utf-8'), offset + length
+    elif tag in (TYPE_LIST, TYPE_DICT):
+        count = struct.unpack_from('!I', data, offset)[0]
+        offset += 4
+        if tag == TYPE_LIST:
+            result = []
+            for i in range(count):
+                item, offset = decode_value(data, offset)
+                result.append(item)
+        else:
+            result = {}
+            for i in range(count):
+                k, offset = decode_value(data, offset)
+                result[k], offset = decode_value(data, offset)
+        return result, offset
+    raise ValueError('Unknown compact protocol type tag {0}'.format(tag))
+
+
+def encode_message(message, event_ids):
+    '''
+    Encodes message by compact protocol: event id from the event table
+    (uint16) followed by the rest of the message as compact value
+    '''
+
+    event = message.get('event', None)
+    event_id = event_ids.get(event, EVENT_BY_NAME)
+    chunks = [struct.pack('!H', event_id)]
+    if event_id == EVENT_BY_NAME:
+        encode_value(event, chunks)
+    encode_value({k: v for k, v in message.items() if k != 'event'}, chunks)
+    return b''.join(chunks)
+
+
+def encode_batch(payloads):
+    chunks = [struct.pack('!HI', EVENT_BATCH, len(payloads))]
+    for payload in payloads:
+        chunks.append(struct.pack('!I', len(payload)))
+        chunks.append(payload)
+    return b''.join(chunks)
+
+
+def decode_message(data, event_names):
+    '''
+    Decodes compact message or batch of messages (returns list). Raises
+    ProtocolError if data is malformed or refers to unknown event id.
+    '''
+
+    try:
+        return _decode_message(data, event_names)
+    except (struct.error, IndexError, TypeError, ValueError) as error:
+        raise ProtocolError.malformed_message_exc(error)
+
+
+def _decode_message(data, event_names):
+    event_id = struct.unpack_from('!H', data)[0]
+    if event_id == EVENT_BATCH:
+        count, offset = struct.unpack_from('!I', data, 2)[0], 6
+        messages = []
+        for i in range(count):
+            length = struct.unpack_from('!I', data, offset)[0]
+            offset += 4
+            messages.append(
+                _decode_message(data[offset:offset + length], event_names))
+            offset += length
+        return messages
+
+    offset = 2
+    if event_id == EVENT_BY_NAME:
+        event, offset = decode_value(data, offset)
+        if not isinstance(event, str):
+            raise ProtocolError.event_name_exc(event)
+    elif event_id <= len(event_names):
+        event = event_names[event_id - 1]
+    else:
+        raise ProtocolError.event_id_exc(event_id, len(event_names))
+    message, offset = decode_value(data, offset)
+    if not isinstance(message, dict):
+        raise ProtocolError.message_type_exc(message)
+    message['event'] = event
+    return message
+
+
+class OutboundMessage(object):
+    '''
+    Outgoing message which is encoded and framed at most once however many
+    connections it is written to.
+    '''
+
+    def __init__(self, message):
+        self.message = message
+
+    @property
+    def text(self):
+        if not hasattr(self, '_text'):
+            self._text = utf8(json_encode(self.message))
+        return self._text
+
+    @property
+    def event_stream(self):
+        ''' Message of Server-Sent Events stream '''
+
+        if not hasattr(self, '_event_stream'):
+            self._event_stream = b'data: ' + self.text + b'\n\n'
+        return self._event_stream
+
+    @property
+    def frame(self):
+        if not hasattr(self, '_frame'):
+            self._frame = make_frame(self.text)
+        return self._frame
+
+    def compact(self, event_ids):
+        if not hasattr(self, '_compact'):
+            self._compact = encode_message(self.message, event_ids)
+        return self._compact
+
+    def deflated_frame(self, payload, opcode, level, wbits, mem_level):
+        '''
+        Returns compressed frame of the given payload. Frame is built once
+        for each compression settings
+        '''
+
+        if not hasattr(self, '_deflated'):
+            self._deflated = {}
+        key = (opcode, level, wbits, mem_level)
+        if not key in self._deflated:
+            self._deflated[key] = make_frame(
+                deflate(payload, level, wbits, mem_level), opcode, FLAG_DEFLATE)
+        return self._deflated[key]
+
+    def compact_frame(self, event_ids):
+        if not hasattr(self, '_compact_frame'):
+            self._compact_frame = make_frame(self.compact(event_ids),
+                OPCODE_BINARY)
+        return self._compact_frame
@@ -1,31 +1,79 @@
-function Meteor() {
+function Meteor(args) {
     var _this = this;
+    var options = $.extend({
+        compact: false,
+        // "auto" falls back to stream transport if websocket fails
+        transport: 'auto'
+    }, args);
 
     this.ready = false;
     this.callbacks = [];
-
-    this.ws = new WebSocket('ws://' + document.location.href.split('/')[2] + '/ws_connection');
+    this.protocol = null;
     this.reactor = new Reactor();
 
-    this.ws.onopen = function() {
+    this.onOpen = function() {
         $(function() {
             _this.ready = true;
             _this.onReady();
         })
     }
 
-    this.ws.onmessage = function(event) {
-        var data = JSON.parse(event.data);
-        var map = _this.reactor.events[data.event] || {};
-        var callback = data.timestamp ? map[data.timestamp] : map['default'];
+    this.receive = function(message) {
+        if (message.event == 'meteor/protocol') {
+            // server accepted compact protocol and sent its event table
+            if (_this.protocol) _this.protocol.setEvents(message.data.events);
+            return;
+        }
+        _this.reactor.react(message);
+    }
 
-        if (callback) {
-            callback(data.data);
+    this.connectWebSocket = function() {
+        var url = 'ws://' + document.location.href.split('/')[2] + '/ws_connection';
+        var ws;
+        if (options.compact && window.ArrayBuffer && window.TextEncoder) {
+            this.protocol = new CompactProtocol();
+            ws = new WebSocket(url, [this.protocol.name]);
+            ws.binaryType = 'arraybuffer';
+        }
+        else {
+            ws = new WebSocket(url);
+        }
 
-            if (data.timestamp) {
-                delete _this.reactor.events[data.event][data.timestamp];
+        var opened = false;
+        ws.onopen = function() {
+            opened = true;
+            _this.onOpen();
+        }
+
+        ws.onclose = function() {
+            if (!opened && options.transport == 'auto') _this.connectStream();
+        }
+
+        ws.onmessage = function(event) {
+            if (typeof event.data != 'string') {
+                _this.reactor.react(_this.protocol.decode(event.data));
+                return;
             }
+            _this.receive(JSON.parse(event.data));
         }
+        return ws;
+    }
+
+    this.connectStream = function() {
+        this.protocol = null;
+        this.transport = new StreamTransport({
+            poll: options.transport == 'poll' || !window.EventSource,
+            onopen: this.onOpen,
+            onreconnect: this.rejoin,
+            onmessage: this.receive
+        });
+    }
+
+    if (options.transport == 'auto' && window.WebSocket || options.transport == 'websocket') {
+        this.transport = this.connectWebSocket();
+    }
+    else {
+        this.connectStream();
     }
 
     this.onReady = function(callback) {
@@ -44,7 +92,148 @@ function Meteor() {
     }
 
     this.send = function(event) {
-        this.ws.send(JSON.stringify(event.message));
+        if (this.protocol && this.transport.protocol == this.protocol.name) {
+            this.transport.send(this.protocol.encode(event.message));
+        }
+        else {
+            this.transport.send(JSON.stringify(event.message));
+        }
+    }
+
+    // channels joined by the client, new stream session joins them again
+    this.channels = {};
+
+    this.join = function(channel, callback) {
+        this.channels[channel] = true;
+        new MeteorEvent({
+            name: 'meteor/join',
+            data: {channel: channel},
+            callback: callback
+        });
+    }
+
+    this.rejoin = function() {
+        $.each(_this.channels, function(channel) {
+            new MeteorEvent({name: 'meteor/join', data: {channel: channel}});
+        });
+    }
+
+    this.leave = function(channel, callback) {
+        delete this.channels[channel];
+        new MeteorEvent({
+            name: 'meteor/leave',
+            data: {channel: channel},
+            callback: callback
+        });
+    }
+
+    this.lastTimestamp = 0;
+
+    this.timestamp = function() {
+        // timestamps identify answers, so they must be unique
+        this.lastTimestamp = Math.max((new Date).getTime(), this.lastTimestamp + 1);
+        return this.lastTimestamp;
+    }
+}
+
+
+function StreamTransport(args) {
+    // Server-Sent Events (or long polling) downstream and POST upstream for
+    // clients which can not use websockets
+    var _this = this;
+    var options = $.extend({
+        poll: false,
+        onopen: null,
+        onreconnect: null,
+        onmessage: null
+    }, args);
+
+    var url = '/stream_connection/';
+    var opened = false;
+    var pending = [];
+    var sending = false;
+
+    this.protocol = '';
+    this.session = null;
+
+    this.receive = function(message) {
+        if (message.event == 'meteor/session') {
+            // first message of the session carries its id
+            _this.session = message.data.session;
+            if (!opened) {
+                opened = true;
+                if (options.onopen) options.onopen();
+            }
+            else if (options.onreconnect) {
+                // new session knows nothing of the previous one, messages
+                // of reconnect (rejoins) go before those queued meanwhile
+                var queued = pending;
+                pending = [];
+                options.onreconnect();
+                pending = pending.concat(queued);
+            }
+            _this.flush();
+            return;
+        }
+        options.onmessage(message);
+    }
+
+    this.poll = function() {
+        $.ajax({
+            url: url + (_this.session || '?transport=poll'),
+            dataType: 'json',
+            cache: false,
+            success: function(messages) {
+                $.each(messages, function() {
+                    _this.receive(this);
+                });
+                _this.poll();
+            },
+            error: function(xhr) {
+                // session is expired, the next poll opens new one
+                if (xhr.status == 404) _this.session = null;
+                setTimeout(_this.poll, 1000);
+            }
+        });
+    }
+
+    this.send = function(data) {
+        pending.push(data);
+        this.flush();
+    }
+
+    this.flush = function() {
+        // messages are sent in order, those queued meanwhile go as batch
+        if (sending || !_this.session || !pending.length) return;
+        var data = pending.length == 1 ? pending[0] : '[' + pending.join(',') + ']';
+        var headers = {};
+        var xsrf = document.cookie.match(/\b_xsrf=([^;]*)/);
+        if (xsrf) headers['X-Xsrftoken'] = xsrf[1];
+
+        pending = [];
+        sending = true;
+        $.ajax({
+            url: url + _this.session,
+            type: 'POST',
+            data: data,
+            contentType: 'application/json',
+            processData: false,
+            headers: headers,
+            complete: function() {
+                sending = false;
+                _this.flush();
+            }
+        });
+    }
+
+    if (options.poll) {
+        this.poll();
+    }
+    else {
+        this.source = new EventSource(url + '?transport=sse');
+        this.source.onmessage = function(event) {
+            _this.receive(JSON.parse(event.data));
+        }
     }
 }
 
@@ -65,6 +254,262 @@ function Reactor() {
             this.events[options.name][key] = options.callback;
         }
     }
+
+    this.react = function(message) {
+        // coalesced messages come as single array frame
+        if ($.isArray(message)) {
+            for (var i = 0; i < message.length; i++) {
+                this.react(message[i]);
+            }
+            return;
+        }
+
+        var map = this.events[message.event] || {};
+        var callback = message.timestamp ? map[message.timestamp] : map['default'];
+
+        if (callback) {
+            callback(message.data);
+
+            if (message.timestamp) {
+                delete this.events[message.event][message.timestamp];
+            }
+        }
+    }
+}
+
+function CompactProtocol() {
+    // type tags and special event ids must match meteor/protocol.py
+    var NONE = 0, FALSE = 1, TRUE = 2, INT8 = 3, INT32 = 4, FLOAT = 5,
+        STR8 = 6, STR32 = 7, LIST = 8, DICT = 9, INT64 = 10;
+    var MAX_SAFE_INTEGER = 9007199254740991, UINT32_RANGE = 0x100000000;
+    var BY_NAME = 0, BATCH = 0xFFFF;
+
+    var encoder = window.TextEncoder ? new TextEncoder() : null;
+    var decoder = window.TextDecoder ? new TextDecoder() : null;
+
+    this.name = 'meteor.compact';
+    this.names = [];
+    this.ids = {};
+
+    this.setEvents = function(names) {
+        this.names = names;
+        this.ids = {};
+        for (var i = 0; i < names.length; i++) {
+            this.ids[names[i]] = i + 1;
+        }
+    }
+
+    this.encode = function(message) {
+        var writer = new Writer();
+        var id = this.ids[message.event] || BY_NAME;
+        var rest = {};
+
+        writer.uint16(id);
+        if (id == BY_NAME) writer.value(message.event);
+        for (var key in message) {
+            if (key != 'event') rest[key] = message[key];
+        }
+        writer.value(rest);
+        return writer.bytes.subarray(0, writer.length);
+    }
+
+    this.decode = function(buffer) {
+        return this.readMessage(new Reader(new DataView(buffer)));
+    }
+
+    this.readMessage = function(reader) {
+        var id = reader.view.getUint16(reader.offset);
+        reader.offset += 2;
+
+        if (id == BATCH) {
+            var count = reader.uint32(), messages = [];
+            for (var i = 0; i < count; i++) {
+                reader.uint32();
+                messages.push(this.readMessage(reader));
+            }
+            return messages;
+        }
+
+        var event = id == BY_NAME ? reader.value() : this.names[id - 1];
+        var message = reader.value();
+        message.event = event;
+        return message;
+    }
+
+    function Writer() {
+        this.bytes = new Uint8Array(256);
+        this.view = new DataView(this.bytes.buffer);
+        this.length = 0;
+
+        this.reserve = function(size) {
+            if (this.length + size > this.bytes.length) {
+                var capacity = this.bytes.length * 2;
+                while (capacity < this.length + size) capacity *= 2;
+
+                var bytes = new Uint8Array(capacity);
+                bytes.set(this.bytes);
+                this.bytes = bytes;
+                this.view = new DataView(bytes.buffer);
+            }
+        }
+
+        this.uint8 = function(value) {
+            this.reserve(1);
+            this.view.setUint8(this.length, value);
+            this.length += 1;
+        }
+
+        this.uint16 = function(value) {
+            this.reserve(2);
+            this.view.setUint16(this.length, value);
+            this.length += 2;
+        }
+
+        this.uint32 = function(value) {
+            this.reserve(4);
+            this.view.setUint32(this.length, value);
+            this.length += 4;
+        }
+
+        this.value = function(value) {
+            if (value === null || value === undefined) {
+                this.uint8(NONE);
+            }
+            else if (typeof value == 'boolean') {
+                this.uint8(value ? TRUE : FALSE);
+            }
+            else if (typeof value == 'number') {
+                if (value % 1 === 0 && value >= -0x80 && value < 0x80) {
+                    this.uint8(INT8);
+                    this.reserve(1);
+                    this.view.setInt8(this.length, value);
+                    this.length += 1;
+                }
+                else if (value % 1 === 0 && value >= -0x80000000 && value < 0x80000000) {
+                    this.uint8(INT32);
+                    this.reserve(4);
+                    this.view.setInt32(this.length, value);
+                    this.length += 4;
+                }
+                else if (value % 1 === 0 && Math.abs(value) <= MAX_SAFE_INTEGER) {
+                    // big-endian int64 as high (signed) and low 32 bits
+                    var high = Math.floor(value / UINT32_RANGE);
+                    this.uint8(INT64);
+                    this.reserve(8);
+                    this.view.setInt32(this.length, high);
+                    this.view.setUint32(this.length + 4, value - high * UINT32_RANGE);
+                    this.length += 8;
+                }
+                else {
+                    this.uint8(FLOAT);
+                    this.reserve(8);
+                    this.view.setFloat64(this.length, value);
+                    this.length += 8;
+                }
+            }
+            else if (typeof value == 'string') {
+                var bytes = encoder.encode(value);
+                if (bytes.length <= 0xFF) {
+                    this.uint8(STR8);
+                    this.uint8(bytes.length);
+                }
+                else {
+                    this.uint8(STR32);
+                    this.uint32(bytes.length);
+                }
+                this.reserve(bytes.length);
+                this.bytes.set(bytes, this.length);
+                this.length += bytes.length;
+            }
+            else if ($.isArray(value)) {
+                this.uint8(LIST);
+                this.uint32(value.length);
+                for (var i = 0; i < value.length; i++) {
+                    this.value(value[i]);
+                }
+            }
+            else {
+                var keys = [];
+                for (var key in value) {
+                    if (value.hasOwnProperty(key)) keys.push(key);
+                }
+                this.uint8(DICT);
+                this.uint32(keys.length);
+                for (var i = 0; i < keys.length; i++) {
+                    this.value(keys[i]);
+                    this.value(value[keys[i]]);
+                }
+            }
+        }
+    }
+
+    function Reader(view) {
+        this.view = view;
+        this.offset = 0;
+
+        this.uint32 = function() {
+            var value = this.view.getUint32(this.offset);
+            this.offset += 4;
+            return value;
+        }
+
+        this.value = function() {
+            var tag = this.view.getUint8(this.offset), value, length;
+            this.offset += 1;
+
+            switch (tag) {
+                case NONE: return null;
+                case FALSE: return false;
+                case TRUE: return true;
+                case INT8:
+                    value = this.view.getInt8(this.offset);
+                    this.offset += 1;
+                    return value;
+                case INT32:
+                    value = this.view.getInt32(this.offset);
+                    this.offset += 4;
+                    return value;
+                case INT64:
+                    value = this.view.getInt32(this.offset) * UINT32_RANGE +
+                        this.view.getUint32(this.offset + 4);
+                    this.offset += 8;
+                    return value;
+                case FLOAT:
+                    value = this.view.getFloat64(this.offset);
+                    this.offset += 8;
+                    return value;
+                case STR8:
+                case STR32:
+                    if (tag == STR8) {
+                        length = this.view.getUint8(this.offset);
+                        this.offset += 1;
+                    }
+                    else {
+                        length = this.uint32();
+                    }
+                    value = decoder.decode(new Uint8Array(
+                        this.view.buffer, this.view.byteOffset + this.offset, length));
+                    this.offset += length;
+                    return value;
+                case LIST:
+                    length = this.uint32();
+                    value = [];
+                    for (var i = 0; i < length; i++) {
+                        value.push(this.value());
+                    }
+                    return value;
+                case DICT:
+                    length = this.uint32();
+                    value = {};
+                    for (var i = 0; i < length; i++) {
+                        var key = this.value();
+                        value[key] = this.value();
+                    }
+                    return value;
+            }
+            throw new Error('Unknown compact protocol type tag ' + tag);
+        }
+    }
 }
 
 function MeteorEvent(args) {
@@ -78,7 +523,7 @@ function MeteorEvent(args) {
     this.message = {"event": options.name, "data": options.data}
     this.callback = options.callback;
 
-    var timestamp = options.callback ? (new Date).getTime() : null
+    var timestamp = options.callback ? meteor.timestamp() : null
     if (timestamp) this.message.timestamp = timestamp;
 
     if (options.callback) {
@@ -91,4 +536,44 @@ function MeteorEvent(args) {
     if (options.autosend) meteor.send(this);
 }
 
-var meteor = new Meteor();
+function MeteorBatch(args) {
+    // events are added by "add" method and sent by single frame. If
+    // combine is true, answers come back by single frame too
+    var options = $.extend({
+        combine: true,
+        callback: null
+    }, args);
+
+    this.events = [];
+
+    this.add = function(args) {
+        this.events.push(new MeteorEvent($.extend({}, args, {autosend: false})));
+        return this;
+    }
+
+    this.send = function() {
+        var messages = [], names = {};
+        $.each(this.events, function() {
+            messages.push(this.message);
+            if (this.message.timestamp) names[this.message.timestamp] = this.message.event;
+        });
+        this.events = [];
+
+        new MeteorEvent({
+            name: 'meteor/batch',
+            data: messages,
+            callback: options.combine ? function(answers) {
+                for (var timestamp in answers) {
+                    meteor.reactor.react({
+                        event: names[timestamp],
+                        timestamp: timestamp,
+                        data: answers[timestamp]
+                    });
+                }
+                if (options.callback) options.callback(answers);
+            } : null
+        });
+    }
+}
+
+var meteor = new Meteor(window.meteorOptions);
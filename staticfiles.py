@@ -0,0 +1,230 @@
+import datetime
+import gzip
+import hashlib
+import logging
+import mimetypes
+import mmap
+import os
+
+import tornado.web
+
+from .exceptions import ConfigurationError
+
+
+# content types which are worth to be compressed besides "text/*"
+COMPRESSIBLE_TYPES = frozenset([
+    'application/javascript', 'application/x-javascript', 'application/json',
+    'application/xml', 'application/wasm', 'image/svg+xml',
+    'image/x-icon', 'image/vnd.microsoft.icon'
+])
+
+
+class StaticFile(object):
+    '''
+    Content of static file: small files are read into memory, large ones are
+    memory-mapped. Compressible files which are read get precomputed gzip
+    variant. Hash of the content is used as strong ETag.
+    '''
+
+    chunk_size = 65536
+
+    def __init__(self, path, options):
+        self.path = path
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size > options['preload_max_size']:
+                self.content = mmap.mmap(f.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+            else:
+                self.content = f.read()
+
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        # the same precision as tornado.web.StaticFileHandler has
+        self.modified = datetime.datetime.fromtimestamp(int(stat.st_mtime),
+            datetime.timezone.utc)
+        self.hash = hashlib.sha1(self.content).hexdigest()
+
+        self.gzipped = None
+        if options['gzip'] and not self.mapped and \
+            self.size >= options['gzip_min_size'] and self.compressible:
+                gzipped = gzip.compress(self.content,
+                    options['gzip_level'], mtime=0)
+                if len(gzipped) < self.size:
+                    self.gzipped = gzipped
+
+    @property
+    def mapped(self):
+        return isinstance(self.content, mmap.mmap)
+
+    @property
+    def compressible(self):
+        mime_type, encoding = mimetypes.guess_type(self.path)
+        if encoding is not None or mime_type is None:
+            return False
+        return mime_type.startswith('text/') or \
+            mime_type in COMPRESSIBLE_TYPES
+
+    def changed(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return stat.st_mtime != self.mtime or stat.st_size != self.size
+
+    def read(self, content, start=None, end=None):
+        ''' Returns bytes of range, mapped content is read by chunks '''
+
+        if not isinstance(content, mmap.mmap):
+            return content[start:end]
+        return self.iter_chunks(content, start or 0,
+            len(content) if end is None else end)
+
+    def iter_chunks(self, content, start, end):
+        for offset in range(start, end, self.chunk_size):
+            yield content[offset:min(offset + self.chunk_size, end)]
+
+
+class MemoryStaticFileHandler(tornado.web.StaticFileHandler):
+    '''
+    Static handler which serves files from memory instead of reading them on
+    each request. Files of the static path are preloaded on start (see
+    "configure"), the others are loaded on the first request. Gzip variant
+    is served if client accepts it and whole file is requested, ranges are
+    served from identity content. In debug mode changed files are reloaded,
+    otherwise files are read once, as tornado caches static versions too.
+    '''
+
+    # loaded files by absolute path
+    files = {}
+
+    # default values of the "static" config section
+    default_options = {
+        'preload': True,
+        'preload_max_size': 262144,
+        'gzip': True,
+        'gzip_min_size': 512,
+        'gzip_level': 9
+    }
+    options = default_options
+
+    @classmethod
+    def configure(cls, static_path, **options):
+        cls.options = dict(cls.default_options, **options)
+        cls.files.clear()
+        if not cls.options['preload'] or not os.path.isdir(static_path):
+            return
+
+        for root, dirs, files in os.walk(static_path):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in files:
+                if not name.startswith('.'):
+                    cls.load(os.path.abspath(os.path.join(root, name)))
+
+        loaded = list(cls.files.values())
+        logging.info('{0} static files preloaded: {1} bytes in memory, {2} '
+            'bytes mapped, {3} gzip variants'.format(len(loaded),
+            sum(f.size for f in loaded if not f.mapped),
+            sum(f.size for f in loaded if f.mapped),
+            sum(1 for f in loaded if f.gzipped is not None)))
+
+    @classmethod
+    def load(cls, path):
+        try:
+            cls.files[path] = StaticFile(path, cls.options)
+        except (OSError, ValueError) as error:
+            logging.warning('Static file "{0}" was not loaded: {1}' \
+                .format(path, error))
+            cls.files.pop(path, None)
+        return cls.files.get(path, None)
+
+    @classmethod
+    def get_file(cls, path, check=False):
+        static_file = cls.files.get(path, None)
+        if static_file is None or check and static_file.changed():
+            static_file = cls.load(path)
+        return static_file
+
+    @classmethod
+    def get_content_version(cls, abspath):
+        # called only when tornado has no cached hash of the file (always
+        # without "static_hash_cache"), so changed file is reloaded
+        static_file = cls.get_file(abspath, check=True)
+        return static_file.hash if static_file is not None else None
+
+    def validate_absolute_path(self, root, absolute_path):
+        # files are loaded only after validation, so loaded path is valid
+        debug = self.settings.get('debug', False)
+        if debug or not absolute_path in self.files:
+            absolute_path = super(MemoryStaticFileHandler, self) \
+                .validate_absolute_path(root, absolute_path)
+            if absolute_path is None:
+                return None
+
+        self.file = self.get_file(absolute_path, check=debug)
+        if self.file is None:
+            raise tornado.web.HTTPError(404)
+        self.gzipped = self.file.gzipped is not None and \
+            not 'Range' in self.request.headers and self.accepts_gzip()
+        return absolute_path
+
+    def accepts_gzip(self):
+        header = self.request.headers.get('Accept-Encoding', '')
+        for coding in header.split(','):
+            name, _, params = coding.partition(';')
+            if name.strip().lower() != 'gzip':
+                continue
+            params = params.replace(' ', '')
+            try:
+                return not params.startswith('q=') or float(params[2:]) > 0
+            except ValueError:
+                return False
+        return False
+
+    @property
+    def variant(self):
+        return self.file.gzipped if self.gzipped else self.file.content
+
+    def get_content(self, abspath, start=None, end=None):
+        '''
+        Unlike the parent classmethod this one is bound to request, it
+        returns the content variant chosen for the request.
+        '''
+
+        return self.file.read(self.variant, start, end)
+
+    def get_content_size(self):
+        return len(self.variant)
+
+    def get_modified_time(self):
+        return self.file.modified
+
+    def compute_etag(self):
+        # each variant is different representation and has own strong ETag
+        return '"{0}{1}"'.format(self.file.hash,
+            '-gzip' if self.gzipped else '')
+
+    def set_headers(self):
+        super(MemoryStaticFileHandler, self).set_headers()
+        if self.file.gzipped is not None:
+            self.set_header('Vary', 'Accept-Encoding')
+        if self.gzipped:
+            self.set_header('Content-Encoding', 'gzip')
+
+
+static_handlers = {
+    'disk': tornado.web.StaticFileHandler,
+    'memory': MemoryStaticFileHandler
+}
+
+
+def create_static_handler(static_path, handler='disk', **options):
+    ''' Returns static handler class configured by the "static" section '''
+
+    if not handler in static_handlers:
+        raise ConfigurationError.option_value_exc('static', 'handler',
+            handler, sorted(static_handlers))
+    handler_class = static_handlers[handler]
+    if hasattr(handler_class, 'configure'):
+        handler_class.configure(static_path, **options)
+    return handler_class
@@ -0,0 +1,256 @@
+import binascii
+import collections
+import os
+
+import tornado.gen
+import tornado.web
+from tornado.concurrent import Future
+from tornado.escape import to_unicode
+
+from .handlers import Connection
+from .protocol import OutboundMessage
+
+
+class StreamSession(Connection):
+    '''
+    Connection of the HTTP transport for clients which can not use
+    websockets. Messages go downstream by Server-Sent Events stream ("sse")
+    or by long polling ("poll") and upstream by POST requests. Polling
+    session outlives its requests and is closed after "session_timeout"
+    seconds without poll, SSE session is closed with its stream. Channels
+    are not restored by the next session: meteor.js joins again the channels
+    joined by the client, channels joined by the application itself are
+    its own business.
+    '''
+
+    # open sessions by id
+    sessions = {}
+
+    # default values of the "stream" config section
+    default_options = dict(Connection.default_options, **{
+        'enabled': False,
+        'poll_timeout': 25,
+        'session_timeout': 60,
+        'keepalive_interval': 15
+    })
+
+    def __init__(self, handler, transport):
+        self.id = to_unicode(binascii.hexlify(os.urandom(16)))
+        self.transport = transport
+        self.application = handler.application
+        self.current_user = handler.current_user
+        self.options = dict(self.default_options,
+            **handler.settings.get('stream', {}))
+        self.init_connection()
+
+        # request which carries messages downstream at the moment
+        self.handler = None
+        self.waiter = None
+        self.writing = False
+        self.timer = None
+        self.closed = False
+        self.outbound = collections.deque()
+        self.outbound_bytes = 0
+        self.dropped = 0
+
+        StreamSession.sessions[self.id] = self
+        self.register()
+        if not self.streaming:
+            self.set_timer(self.options['session_timeout'], self.close)
+
+    @property
+    def streaming(self):
+        return self.transport == 'sse'
+
+    @property
+    def greeting(self):
+        return OutboundMessage({
+            'event': 'meteor/session',
+            'data': {'session': self.id, 'transport': self.transport}
+        })
+
+    def attach(self, handler):
+        '''
+        Attaches downstream request. Returns Future which is resolved when
+        the request should be finished.
+        '''
+
+        self.release_waiter()
+        self.set_timer(None)
+        self.handler = handler
+        self.waiter = Future()
+        if self.streaming:
+            self.set_timer(self.options['keepalive_interval'], self.keepalive)
+            self.flush()
+        elif self.outbound:
+            self.release_waiter()
+        else:
+            self.set_timer(self.options['poll_timeout'], self.release_waiter)
+        return self.waiter
+
+    def detach(self, handler):
+        ''' Called when downstream request is finished or lost '''
+
+        if handler is not self.handler:
+            return
+        self.handler = None
+        self.set_timer(None)
+        self.release_waiter()
+        if self.streaming:
+            self.close()
+        elif not self.closed:
+            self.set_timer(self.options['session_timeout'], self.close)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.set_timer(None)
+        self.unregister()
+        StreamSession.sessions.pop(self.id, None)
+        self.release_waiter()
+        self.outbound.clear()
+        self.outbound_bytes = 0
+        self.inbound.clear()
+
+    def set_timer(self, delay, callback=None):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if delay:
+            self.timer = self.schedule(delay, callback)
+
+    def release_waiter(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def encoded(self, message):
+        return message.event_stream if self.streaming else message.text
+
+    def push(self, message, critical=True):
+        '''
+        Queues OutboundMessage until downstream request takes it. Queue size
+        is bounded by "max_buffer_size" option, the oldest messages are
+        dropped on overflow.
+        '''
+
+        if self.closed:
+            return 0
+
+        size = len(self.encoded(message))
+        self.outbound.append((message, critical))
+        self.outbound_bytes += size
+        while len(self.outbound) > 1 and \
+            self.outbound_bytes > self.options['max_buffer_size']:
+                dropped = self.outbound.popleft()[0]
+                self.outbound_bytes -= len(self.encoded(dropped))
+                self.dropped += 1
+
+        if self.handler is not None:
+            if self.streaming:
+                self.flush()
+            else:
+                # all the messages pushed during this IOLoop iteration are
+                # sent by single response
+                self.release_waiter()
+        return size
+
+    def take(self):
+        ''' Returns queued messages as JSON array and clears the queue '''
+
+        payload = b'[' + b','.join(m.text for m, c in self.outbound) + b']'
+        self.outbound.clear()
+        self.outbound_bytes = 0
+        return payload
+
+    def flush(self):
+        if self.handler is None or self.writing or not self.outbound:
+            return
+        chunk = b''.join(self.encoded(m) for m, c in self.outbound)
+        self.outbound.clear()
+        self.outbound_bytes = 0
+        self.write(chunk)
+
+    def keepalive(self):
+        # comment line keeps proxies from closing idle stream
+        self.timer = None
+        if not self.writing:
+            self.write(b':\n\n')
+        self.set_timer(self.options['keepalive_interval'], self.keepalive)
+
+    def write(self, chunk):
+        self.writing = True
+        self.handler.write(chunk)
+        self.handler.flush().add_done_callback(self._on_flushed)
+
+    def _on_flushed(self, future):
+        self.writing = False
+        # lost stream is detached by "on_connection_close"
+        if future.exception() is None:
+            self.flush()
+
+
+class StreamConnection(tornado.web.RequestHandler):
+    '''
+    HTTP endpoint of StreamSession. GET without session id opens new session
+    ("transport" argument is "sse" or "poll"), GET with session id polls it
+    and POST sends message (or batch of messages) to it.
+    '''
+
+    session_class = StreamSession
+
+    transports = ('sse', 'poll')
+
+    def initialize(self):
+        self.session = None
+        self.closed = False
+
+    def get_session(self, session_id):
+        session = self.session_class.sessions.get(session_id, None)
+        if session is None:
+            raise tornado.web.HTTPError(404)
+        # users are loaded per request, so they are compared by keys
+        if session.presence_id != session.presence_key(self.current_user):
+            raise tornado.web.HTTPError(403)
+        return session
+
+    @tornado.gen.coroutine
+    def get(self, session_id=None):
+        if session_id:
+            self.session = self.get_session(session_id)
+            if self.session.streaming:
+                raise tornado.web.HTTPError(400)
+        else:
+            transport = self.get_argument('transport', 'sse')
+            if not transport in self.transports:
+                raise tornado.web.HTTPError(400)
+            self.session = self.session_class(self, transport)
+
+        self.set_header('Cache-Control', 'no-cache')
+        if self.session.streaming:
+            self.set_header('Content-Type', 'text/event-stream')
+            self.set_header('X-Accel-Buffering', 'no')
+            self.session.push(self.session.greeting)
+            yield self.session.attach(self)
+        else:
+            self.set_header('Content-Type', 'application/json')
+            if session_id:
+                yield self.session.attach(self)
+                # messages stay queued for the next poll if request is lost
+                if not self.closed:
+                    self.write(self.session.take())
+            else:
+                self.write(b'[' + self.session.greeting.text + b']')
+        self.session.detach(self)
+        if not self.closed:
+            self.finish()
+
+    def post(self, session_id=None):
+        session = self.get_session(session_id)
+        session.on_message(to_unicode(self.request.body))
+        self.set_status(204)
+
+    def on_connection_close(self):
+        self.closed = True
+        if self.session is not None:
+            self.session.detach(self)
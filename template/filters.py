@@ -4,14 +4,26 @@ from ..helpers.strings import trim as string_trim
 
 
 class TemplateFilter(object):
+    '''
+    Filter applied by "|" operator. Filters are shared by all the templates,
+    so they are immutable: calling filter with arguments returns configured
+    copy instead of changing the filter itself.
+    '''
+
     autoescape = True
 
     def __ror__(self, string):
         return self.transform(string)
 
     def __call__(self, *args, **kwargs):
-        self.__init__(*args, **kwargs)
-        return self
+        return self.__class__(*args, **kwargs)
+
+
+def get_filters(module):
+    ''' Returns TemplateFilter instances of the module by names '''
+
+    return {name: obj for name, obj in vars(module).items()
+        if isinstance(obj, TemplateFilter)}
 
 
 class Escape(TemplateFilter):
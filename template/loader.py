@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import marshal
+import os
+import re
+import sys
+import time
+
+import tornado
+import tornado.escape
+import tornado.template
+
+
+# templates whose code depends on other templates are never cached on disk
+DEPENDENCY_RE = re.compile(br'{%-?\s*(extends|include|module)\b')
+
+# CachedTemplate parses its source by private tornado API (tested with
+# tornado 5.0 - 6.5), templates are compiled as usual if it's missing
+CACHE_SUPPORTED = all(hasattr(tornado.template, name)
+    for name in ('_TemplateReader', '_File', '_parse'))
+
+
+class CachedTemplate(tornado.template.Template):
+    '''
+    Template restored from compiled code without parsing. Source is parsed
+    only if other template extends this one and needs its blocks.
+    '''
+
+    def __init__(self, name, source, whitespace, code, compiled, loader):
+        self.name = name
+        self.source = source
+        self.whitespace = whitespace
+        self.code = code
+        self.compiled = compiled
+        self.loader = loader
+        self.autoescape = loader.autoescape
+        self.namespace = loader.namespace
+
+    @property
+    def file(self):
+        if not hasattr(self, '_file'):
+            reader = tornado.template._TemplateReader(self.name,
+                tornado.escape.native_str(self.source), self.whitespace)
+            self._file = tornado.template._File(self,
+                tornado.template._parse(reader, self))
+        return self._file
+
+
+class PrecompiledLoader(tornado.template.Loader):
+    '''
+    Template loader which measures compile time of each template and keeps
+    compiled code on disk if "cache_path" is given. Cached code is keyed by
+    hash of the template source and compile options, so changed template is
+    compiled again.
+    '''
+
+    def __init__(self, root_directory, cache_path=None, **kwargs):
+        super(PrecompiledLoader, self).__init__(root_directory, **kwargs)
+        self.cache_path = cache_path
+        self.compile_times = {}
+
+    def _create_template(self, name):
+        start = time.time()
+        with open(os.path.join(self.root, name), 'rb') as f:
+            source = f.read()
+
+        template = None
+        cache_file = None
+        if self.cache_path and CACHE_SUPPORTED and \
+            not DEPENDENCY_RE.search(source):
+                whitespace = self.get_whitespace(name)
+                cache_file = os.path.join(self.cache_path,
+                    self.cache_key(name, source, whitespace) + '.cache')
+                template = self.load_cached(name, source, whitespace,
+                    cache_file)
+
+        if template is None:
+            template = tornado.template.Template(source, name=name,
+                loader=self)
+            if cache_file is not None:
+                self.store_cached(template, cache_file)
+
+        self.compile_times[name] = time.time() - start
+        return template
+
+    def get_whitespace(self, name):
+        # the same default as tornado.template.Template uses
+        if self.whitespace:
+            return self.whitespace
+        return 'single' if name.endswith(('.html', '.js')) else 'all'
+
+    def cache_key(self, name, source, whitespace):
+        options = '\0'.join([name, str(self.autoescape), whitespace,
+            tornado.version, sys.version])
+        return hashlib.sha1(source + options.encode('utf-8')).hexdigest()
+
+    def load_cached(self, name, source, whitespace, cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                code, compiled = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return CachedTemplate(name, source, whitespace, code, compiled, self)
+
+    def store_cached(self, template, cache_file):
+        try:
+            if not os.path.exists(self.cache_path):
+                os.makedirs(self.cache_path)
+            temp_file = '{0}.{1}'.format(cache_file, os.getpid())
+            with open(temp_file, 'wb') as f:
+                marshal.dump((template.code, template.compiled), f)
+            os.replace(temp_file, cache_file)
+        except OSError as error:
+            logging.warning('Compiled template "{0}" was not cached: {1}' \
+                .format(template.name, error))
+
+
+def precompile(template_paths, wrapper_path, cache_path=None, **kwargs):
+    '''
+    Creates loader for each of the template paths and compiles all the
+    templates found in it together with page wrapper. Returns dict of
+    loaders by template paths.
+    '''
+
+    loaders = {}
+    start = time.time()
+    count = 0
+    for template_path in template_paths:
+        loader = PrecompiledLoader(template_path, cache_path, **kwargs)
+        names = [wrapper_path]
+        if os.path.isdir(template_path):
+            for root, dirs, files in os.walk(template_path):
+                names.extend(os.path.relpath(os.path.join(root, f),
+                    template_path) for f in files if not f.startswith('.'))
+        for name in names:
+            try:
+                loader.load(name)
+            except Exception:
+                logging.exception('Template "{0}" was not compiled' \
+                    .format(name))
+        for name, compile_time in sorted(loader.compile_times.items()):
+            logging.debug('Template "{0}" compiled in {1:.2f} ms' \
+                .format(name, compile_time * 1000))
+        count += len(loader.compile_times)
+        loaders[template_path] = loader
+
+    logging.info('{0} templates compiled in {1:.2f} ms'.format(count,
+        (time.time() - start) * 1000))
+    return loaders
@@ -0,0 +1,6 @@
+'''
+Regression checks of the modules which do not need MongoDB. Run them from
+the directory containing meteor package:
+
+    python -m unittest discover -s meteor/tests -t .
+'''
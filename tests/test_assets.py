@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..assets import AssetBuilder, join_css, minify_css, minify_js, \
+    rebase_css_urls
+from ..client import StaticManager
+
+
+class Package(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class MinifyTest(unittest.TestCase):
+    def test_css(self):
+        source = b'''/* comment */
+            a > b ,  c {
+                content: "  /* kept */  ";
+                color: red;
+            }
+        '''
+        self.assertEqual(minify_css(source),
+            b'a>b,c{content: "  /* kept */  ";color: red}')
+
+    def test_js(self):
+        source = b'''/* header
+             * comment */
+            function f() {
+                // comment
+                return 1;
+            }
+
+            /*! license */
+        '''
+        self.assertEqual(minify_js(source),
+            b'function f() {\nreturn 1;\n}\n/*! license */')
+
+    def test_js_continued_string(self):
+        source = b'var s = "a\\\n    b\\\n    // c";\n    f();'
+        self.assertEqual(minify_js(source),
+            b'var s = "a\\\n    b\\\n    // c";\nf();')
+
+    def test_js_template_literal(self):
+        source = b'var s = `a\n    b`;'
+        self.assertEqual(minify_js(source), source)
+
+
+class CssBundleTest(unittest.TestCase):
+    def test_rebase_urls(self):
+        source = (b'@import "theme.css";a{background:url(img/a.png?v=1)}'
+            b"b{background:url( 'http://cdn/b.png' ) url(/c.png) "
+            b'url(data:image/png;base64,AA) url("../d.png#x")}')
+        self.assertEqual(rebase_css_urls(source, '/s/styles', '/s/bundles'),
+            b'@import "../styles/theme.css";'
+            b'a{background:url(../styles/img/a.png?v=1)}'
+            b"b{background:url( 'http://cdn/b.png' ) url(/c.png) "
+            b'url(data:image/png;base64,AA) url("../d.png#x")}')
+
+    def test_header_rules_are_hoisted(self):
+        with self.assertLogs(level='WARNING'):
+            bundle = join_css([
+                b'/*! license */@charset "UTF-8";@import "a.css";a{}',
+                b'@charset "UTF-8";@import url(b.css) screen;b{}'
+            ])
+        self.assertEqual(bundle, b'@charset "UTF-8";\n@import "a.css";\n'
+            b'@import url(b.css) screen;\n/*! license */\na{}\nb{}')
+
+
+class AssetBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.static_path = tempfile.mkdtemp(prefix='meteor-static-')
+        self.write('styles/base.css', b'a { background: url(img/a.png) }')
+        self.write('chat/app.css', b'@import "theme.css";\nb { color: red }')
+        self.write('libs/meteor.js', b'function f() {\n    return 1;\n}')
+
+    def tearDown(self):
+        shutil.rmtree(self.static_path)
+
+    def write(self, path, data):
+        path = os.path.join(self.static_path, path)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def build(self):
+        manager = StaticManager(self.static_path, {}, [Package('chat')])
+        with self.assertLogs(level='INFO'):
+            return AssetBuilder(manager).build()
+
+    def read(self, path):
+        with open(os.path.join(self.static_path, path), 'rb') as f:
+            return f.read()
+
+    def test_bundle(self):
+        manifest = self.build()
+        self.assertEqual(self.read(manifest['bundles']['css']['chat']),
+            b'@import "../chat/theme.css";\n'
+            b'a{background: url(../styles/img/a.png)}\nb{color: red}')
+        self.assertEqual(self.read(manifest['libs']['js']['meteor']),
+            b'function f() {\nreturn 1;\n}')
+
+    def test_previous_generation_is_kept(self):
+        first = self.build()['libs']['js']['meteor']
+        self.write('libs/meteor.js', b'function g() {}')
+        second = self.build()['libs']['js']['meteor']
+        self.write('libs/meteor.js', b'function h() {}')
+        third = self.build()['libs']['js']['meteor']
+        bundles = os.path.join(self.static_path, 'bundles')
+        for path, exists in ((first, False), (second, True), (third, True)):
+            self.assertEqual(os.path.exists(
+                os.path.join(self.static_path, path)), exists)
+        self.assertTrue(os.path.exists(
+            os.path.join(bundles, AssetBuilder.manifest_name)))
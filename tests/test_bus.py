@@ -0,0 +1,91 @@
+import asyncio
+import os
+import shutil
+import socket
+import tempfile
+
+import tornado.testing
+
+from ..bus import BroadcastBus, UnixSocketBus, create_bus
+from ..exceptions import ConfigurationError
+
+
+class UnixSocketBusTest(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(UnixSocketBusTest, self).setUp()
+        self.root = tempfile.mkdtemp(prefix='meteor-bus-test-')
+        self.path = os.path.join(self.root, 'bus')
+        self.buses = []
+
+    def tearDown(self):
+        for bus in self.buses:
+            bus.stop()
+        shutil.rmtree(self.root)
+        super(UnixSocketBusTest, self).tearDown()
+
+    def start(self, name, path=None):
+        delivered = []
+        bus = UnixSocketBus(path=path or self.path, name=name)
+        bus.start(lambda **broadcast: delivered.append(broadcast))
+        self.buses.append(bus)
+        return bus, delivered
+
+    async def wait(self, delivered, count=1):
+        for i in range(100):
+            if len(delivered) >= count:
+                return
+            await asyncio.sleep(0.01)
+
+    @tornado.testing.gen_test
+    async def test_forwards_to_siblings(self):
+        first, first_delivered = self.start('first')
+        second, second_delivered = self.start('second')
+        sent = first.publish({
+            'message': {'event': 'chat/new', 'data': {'ts': 1760812345679}},
+            'channels': None, 'users': set([b'user']), 'critical': True
+        })
+        self.assertEqual(sent, 1)
+        await self.wait(second_delivered)
+        self.assertEqual(second_delivered, [{
+            'message': {'event': 'chat/new', 'data': {'ts': 1760812345679}},
+            'channels': None, 'users': ['user'], 'critical': True
+        }])
+        self.assertEqual(first_delivered, [])
+
+    def test_directory_is_private(self):
+        self.start('first')
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o700)
+
+    def test_refuses_shared_directory(self):
+        os.mkdir(self.path)
+        os.chmod(self.path, 0o755)
+        bus = UnixSocketBus(path=self.path, name='first')
+        self.assertRaises(ConfigurationError, bus.start, lambda **kw: None)
+        self.assertIsNone(bus.socket)
+
+    @tornado.testing.gen_test
+    async def test_ignores_invalid_datagram(self):
+        first, delivered = self.start('first')
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        with tornado.testing.ExpectLog('root', 'Failed to deliver'):
+            sender.sendto(b'\x00not json', first.address)
+            sender.close()
+            await asyncio.sleep(0.05)
+        self.assertEqual(delivered, [])
+
+    def test_name_is_chosen_on_start(self):
+        bus = UnixSocketBus(path=self.path)
+        self.assertIsNone(bus.name)
+        bus.start(lambda **kw: None)
+        self.buses.append(bus)
+        self.assertEqual(bus.name, str(os.getpid()))
+
+    def test_default_path_depends_on_application(self):
+        self.assertNotEqual(UnixSocketBus.default_path('/app:8888'),
+            UnixSocketBus.default_path('/app:8889'))
+        self.assertEqual(UnixSocketBus('/app:8888').path,
+            UnixSocketBus.default_path('/app:8888'))
+
+    def test_create_bus(self):
+        self.assertIsInstance(create_bus(app_id='/app:8888'), BroadcastBus)
+        self.assertRaises(ConfigurationError, create_bus, 'redis')
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..client import StaticManager
+from ..exceptions import StaticError
+
+
+class Package(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class StaticChainTest(unittest.TestCase):
+    def setUp(self):
+        self.static_path = tempfile.mkdtemp(prefix='meteor-static-')
+        for path in ('libs/jquery.js', 'libs/meteor.js', 'libs/plugin.js',
+                'styles/base.css', 'chat/app.js', 'chat/app.css'):
+            path = os.path.join(self.static_path, path)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.static_path)
+
+    def manager(self, requirements):
+        return StaticManager(self.static_path, requirements,
+            [Package('chat')])
+
+    def names(self, chain):
+        return [lib.full_name for lib in chain]
+
+    def test_requirements_go_first(self):
+        manager = self.manager({
+            'plugin.js': ['meteor'], 'meteor.js': ['jquery']
+        })
+        chain = self.names(manager.get_chain('js', 'chat'))
+        self.assertEqual(sorted(chain),
+            ['chat/app', 'jquery', 'meteor', 'plugin'])
+        for lib, requirement in (('meteor', 'jquery'), ('plugin', 'meteor'),
+                ('chat/app', 'meteor')):
+            self.assertLess(chain.index(requirement), chain.index(lib))
+
+    def test_common_chain(self):
+        manager = self.manager({'meteor.js': ['jquery']})
+        self.assertEqual(sorted(self.names(manager.get_chain('js'))),
+            ['jquery', 'meteor', 'plugin'])
+        self.assertEqual(self.names(manager.get_chain('css', 'chat')),
+            ['base', 'chat/app'])
+
+    def test_chain_of_unknown_package(self):
+        manager = self.manager({'meteor.js': ['jquery']})
+        self.assertEqual(self.names(manager.get_chain('js', 'unknown')),
+            self.names(manager.get_chain('js')))
+
+    def test_missing_requirement(self):
+        with self.assertRaises(StaticError) as context:
+            self.manager({'meteor.js': ['jquery', 'underscore']})
+        self.assertIn('"underscore"', str(context.exception))
+
+    def test_cyclic_requirements(self):
+        with self.assertRaises(StaticError) as context:
+            self.manager({
+                'jquery.js': ['plugin'], 'meteor.js': ['jquery'],
+                'plugin.js': ['meteor']
+            })
+        self.assertIn('cyclic', str(context.exception))
+
+    def test_lib_requiring_itself(self):
+        self.assertRaises(StaticError, self.manager,
+            {'meteor.js': ['meteor']})
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import unittest
+
+import tornado.testing
+import tornado.web
+import tornado.websocket
+
+from ..handlers import Connection, EventHandler, WSConnection
+from ..protocol import OutboundMessage, deflate_memory, inflate_memory
+
+
+class Echo(EventHandler):
+    event = 'echo'
+
+    def handling(self, data):
+        self.broadcast('tests/echo', data)
+
+
+class Router(object):
+    events = {'tests/echo': Echo}
+    event_names = ['tests/echo']
+    event_ids = {'tests/echo': 1}
+
+
+class ConnectionTestCase(tornado.testing.AsyncHTTPTestCase):
+    ''' Application with websocket connection only '''
+
+    connection_class = WSConnection
+    options = {}
+    connections = 0
+
+    def setUp(self):
+        super(ConnectionTestCase, self).setUp()
+        Connection.users.clear()
+        Connection.channels.clear()
+
+    def get_app(self):
+        app = tornado.web.Application(
+            [('/ws_connection', self.connection_class)],
+            websocket=dict(self.options))
+        app.databases = {}
+        app.router = Router()
+        return app
+
+    async def connect(self, **kwargs):
+        url = 'ws://127.0.0.1:{0}/ws_connection'.format(self.get_http_port())
+        client = await tornado.websocket.websocket_connect(url, **kwargs)
+        # connection is registered by the server a bit later
+        for i in range(100):
+            if len(Connection.users) >= self.connections + 1:
+                break
+            await asyncio.sleep(0.01)
+        self.connections += 1
+        return client
+
+    def connection(self):
+        return next(iter(Connection.users))
+
+    def send(self, client, event, data):
+        client.write_message(json.dumps({'event': event, 'data': data}))
+
+    async def receive(self, client):
+        return json.loads(await client.read_message())
+
+
+class CompressionTest(ConnectionTestCase):
+    options = {'compression': True, 'compression_min_size': 100}
+
+    @tornado.testing.gen_test
+    async def test_memory_of_persistent_compressor(self):
+        # without "no context takeover" requested by client tornado keeps
+        # persistent zlib objects whatever the options are
+        client = await self.connect(compression_options={})
+        connection = self.connection()
+        self.assertTrue(connection.shared_compression)
+        self.assertIsNotNone(connection.compressor)
+        stats = connection.compression_stats
+        self.assertTrue(stats['enabled'])
+        self.assertEqual(stats['memory'],
+            deflate_memory(connection.deflate_wbits, 8) +
+            inflate_memory(connection.inflate_wbits))
+
+        self.send(client, 'tests/echo', {'text': 'x' * 500})
+        message = await self.receive(client)
+        self.assertEqual(message['data']['text'], 'x' * 500)
+        self.assertEqual(connection.compression_stats['messages'], 1)
+
+    @tornado.testing.gen_test
+    async def test_without_compression(self):
+        await self.connect()
+        stats = self.connection().compression_stats
+        self.assertFalse(stats['enabled'])
+        self.assertEqual(stats['memory'], 0)
+
+
+class MalformedMessageTest(ConnectionTestCase):
+    @tornado.testing.gen_test
+    async def test_malformed_messages_are_rejected(self):
+        client = await self.connect()
+        connection = self.connection()
+        with self.assertLogs(level='WARNING'):
+            client.write_message('{"event": ')
+            client.write_message('[1, {"event": ["tests/echo"]}]')
+            client.write_message(b'\x00\x07\x0b\x00\x00\x00\x00', binary=True)
+            self.send(client, 'tests/echo', {'text': 'hi'})
+            message = await self.receive(client)
+        self.assertEqual(message['data'], {'text': 'hi'})
+        self.assertEqual(connection.rejected['!protocol'], 4)
+        client.close()
+
+
+class WriteMessageTest(ConnectionTestCase):
+    @tornado.testing.gen_test
+    async def test_non_event_messages(self):
+        client = await self.connect()
+        connection = self.connection()
+        connection.write_message('text')
+        connection.write_message([1, 2])
+        self.assertEqual(await self.receive(client), 'text')
+        self.assertEqual(await self.receive(client), [1, 2])
+        client.close()
+
+
+class JoinTest(ConnectionTestCase):
+    options = {'max_channels': 2, 'max_channel_length': 8}
+
+    async def join(self, client, channel):
+        client.write_message(json.dumps({'event': 'meteor/join',
+            'timestamp': 1, 'data': {'channel': channel}}))
+        return (await self.receive(client))['data']['joined']
+
+    @tornado.testing.gen_test
+    async def test_channel_names(self):
+        client = await self.connect()
+        self.assertTrue(await self.join(client, 'chat'))
+        for channel in ('', 'x' * 9, ['chat'], {'a': 1}, 5, None):
+            self.assertFalse(await self.join(client, channel))
+        self.assertEqual(self.connection().subscriptions, set(['chat']))
+        client.close()
+
+    @tornado.testing.gen_test
+    async def test_channels_limit(self):
+        client = await self.connect()
+        connection = self.connection()
+        self.assertTrue(await self.join(client, 'first'))
+        self.assertTrue(await self.join(client, 'second'))
+        self.assertFalse(await self.join(client, 'third'))
+        self.assertTrue(await self.join(client, 'first'))
+        self.assertEqual(connection.rejected['meteor/join'], 1)
+        self.assertNotIn('third', Connection.channels)
+        client.close()
+
+
+class SlowConsumerTest(ConnectionTestCase):
+    # coalesced messages are always queued first
+    options = {'coalesce': True, 'max_buffer_size': 100}
+
+    def push(self, connection, text, critical=True):
+        return connection.push(OutboundMessage(
+            {'event': 'tests/echo', 'data': text}), critical)
+
+    @tornado.testing.gen_test
+    async def test_push_of_dropped_message(self):
+        client = await self.connect()
+        connection = self.connection()
+        self.assertGreater(self.push(connection, 'x'), 0)
+        self.assertEqual(self.push(connection, 'x' * 100), 0)
+        self.assertEqual(connection.queue_stats['dropped'], 2)
+        client.close()
+
+    @tornado.testing.gen_test
+    async def test_push_to_disconnected_consumer(self):
+        client = await self.connect()
+        connection = self.connection()
+        connection.options = dict(connection.options,
+            slow_consumer_policy='disconnect')
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(self.push(connection, 'x' * 100), 0)
+        self.assertTrue(connection.queue_stats['disconnected'])
+        self.assertEqual(self.push(connection, 'x'), 0)
+        client.close()
+
+
+class AbstractConnectionTest(unittest.TestCase):
+    def test_push_is_abstract(self):
+        self.assertRaises(TypeError, Connection)
+
+        class Transport(Connection):
+            pass
+        self.assertRaises(TypeError, Transport)
+
+
+class PooledEcho(Echo):
+    pooled = True
+    pool_size = 1
+
+
+class PooledEchoChild(PooledEcho):
+    pass
+
+
+class EventHandlerPoolTest(unittest.TestCase):
+    def test_pool_is_created_lazily_per_class(self):
+        handler = PooledEcho.acquire(None)
+        PooledEcho.release(handler)
+        PooledEcho.release(PooledEcho(None))
+        self.assertEqual(PooledEcho.get_pool(), [handler])
+        self.assertIsNot(PooledEchoChild.acquire(None), handler)
+        self.assertEqual(PooledEchoChild.get_pool(), [])
+        self.assertIs(PooledEcho.acquire(None), handler)
+
+    def test_not_pooled(self):
+        Echo.release(Echo(None))
+        self.assertNotIn('_pool', Echo.__dict__)
@@ -0,0 +1,55 @@
+import unittest
+
+from ..handlers import Connection
+from ..presence import Presence
+
+
+class User(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class PresenceKeyTest(unittest.TestCase):
+    def test_keys(self):
+        self.assertIsNone(Connection.presence_key(None))
+        self.assertEqual(Connection.presence_key('alice'), 'alice')
+        self.assertEqual(Connection.presence_key(b'alice'), 'alice')
+        self.assertEqual(Connection.presence_key(7), 7)
+        self.assertEqual(Connection.presence_key({'id': 7, 'name': 'x'}), 7)
+        self.assertEqual(Connection.presence_key(User(7)), 7)
+        self.assertEqual(Connection.presence_key(['alice']), "['alice']")
+
+
+class PresenceTest(unittest.TestCase):
+    def setUp(self):
+        self.presence = Presence()
+
+    def test_same_user_loaded_twice(self):
+        first, second = object(), object()
+        self.assertTrue(self.presence.add(
+            Connection.presence_key(User(1)), first))
+        self.assertFalse(self.presence.add(
+            Connection.presence_key(User(1)), second))
+        self.assertEqual(self.presence.users_count, 1)
+        self.assertEqual(self.presence.connections_count, 2)
+        self.assertFalse(self.presence.remove(1, first))
+        self.assertTrue(self.presence.remove(1, second))
+        self.assertEqual(self.presence.users_count, 0)
+
+    def test_dict_user(self):
+        key = Connection.presence_key({'id': 'alice'})
+        self.assertTrue(self.presence.add(key, object()))
+        self.assertTrue(self.presence.is_online('alice'))
+
+    def test_anonymous_connections(self):
+        first, second = object(), object()
+        self.assertFalse(self.presence.add(None, first))
+        self.assertFalse(self.presence.add(None, second))
+        self.presence.add('alice', object())
+        self.assertEqual(self.presence.anonymous_count, 2)
+        self.assertEqual(self.presence.users_count, 1)
+        self.assertEqual(self.presence.connections_count, 3)
+        self.presence.remove(None, first)
+        self.presence.remove(None, first)
+        self.assertEqual(self.presence.anonymous_count, 1)
+        self.assertEqual(self.presence.connections_count, 2)
@@ -0,0 +1,168 @@
+import json
+import os
+import shutil
+import struct
+import subprocess
+import unittest
+
+from ..exceptions import ProtocolError
+from ..protocol import OutboundMessage, TYPE_FLOAT, TYPE_INT8, TYPE_INT32, \
+    TYPE_INT64, decode_message, decode_value, encode_batch, encode_message, \
+    encode_value
+
+
+METEOR_JS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'static', 'meteor.js')
+
+# runs CompactProtocol of meteor.js: decodes hex given as argument, prints it
+# as JSON and prints hex of the same message encoded again
+NODE_SCRIPT = r'''
+var fs = require('fs');
+global.window = {TextEncoder: TextEncoder, TextDecoder: TextDecoder};
+global.$ = {isArray: Array.isArray};
+var source = fs.readFileSync(process.argv[1], 'utf8');
+var start = source.indexOf('function CompactProtocol'), depth = 0, end;
+for (end = source.indexOf('{', start); ; end++) {
+    if (source[end] == '{') depth++;
+    if (source[end] == '}' && !--depth) break;
+}
+eval(source.slice(start, end + 1));
+var protocol = new CompactProtocol();
+protocol.setEvents(JSON.parse(process.argv[2]));
+var bytes = Buffer.from(process.argv[3], 'hex');
+var message = protocol.decode(
+    bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + bytes.length));
+console.log(JSON.stringify(message));
+console.log(Buffer.from(protocol.encode(message)).toString('hex'));
+'''
+
+
+def encoded(value):
+    chunks = []
+    encode_value(value, chunks)
+    return b''.join(chunks)
+
+
+class CompactValueTest(unittest.TestCase):
+    def assertRoundTrip(self, value):
+        data = encoded(value)
+        decoded, offset = decode_value(data)
+        self.assertEqual(decoded, value)
+        self.assertEqual(type(decoded), type(value))
+        self.assertEqual(offset, len(data))
+
+    def test_scalars(self):
+        for value in (None, True, False, 0, -1, 1.5, '', 'text', 'юникод'):
+            self.assertRoundTrip(value)
+
+    def test_integer_types(self):
+        for value, tag in ((127, TYPE_INT8), (-128, TYPE_INT8),
+                (128, TYPE_INT32), (-2 ** 31, TYPE_INT32),
+                (2 ** 31, TYPE_INT64), (-2 ** 31 - 1, TYPE_INT64),
+                (2 ** 63 - 1, TYPE_INT64), (-2 ** 63, TYPE_INT64)):
+            self.assertEqual(encoded(value)[0], tag)
+            self.assertRoundTrip(value)
+
+    def test_timestamp_stays_integer(self):
+        self.assertRoundTrip(1760812345679)
+
+    def test_integer_out_of_int64_is_float(self):
+        self.assertEqual(encoded(2 ** 64)[0], TYPE_FLOAT)
+        self.assertEqual(decode_value(encoded(2 ** 64))[0], float(2 ** 64))
+
+    def test_long_string(self):
+        self.assertRoundTrip('x' * 70000)
+
+    def test_containers(self):
+        self.assertRoundTrip([1, [2, {'a': None}], 'b'])
+        self.assertRoundTrip({'a': {'b': [1.25, True]}, 'c': ''})
+
+    def test_tuple_and_bytes(self):
+        self.assertEqual(decode_value(encoded((1, b'x')))[0], [1, 'x'])
+
+    def test_non_string_keys(self):
+        self.assertEqual(decode_value(encoded({1: 2}))[0], {'1': 2})
+
+    def test_unknown_type(self):
+        self.assertRaises(TypeError, encoded, object())
+        self.assertRaises(ValueError, decode_value, b'\xff')
+
+
+class CompactMessageTest(unittest.TestCase):
+    event_names = ['chat/new_message', 'meteor/batch']
+    event_ids = {name: i + 1 for i, name in enumerate(event_names)}
+
+    def test_event_by_id(self):
+        message = {'event': 'chat/new_message', 'data': {'msg': 'hi'},
+            'timestamp': 1760812345679}
+        data = encode_message(message, self.event_ids)
+        self.assertEqual(struct.unpack_from('!H', data)[0], 1)
+        self.assertEqual(decode_message(data, self.event_names), message)
+
+    def test_event_by_name(self):
+        message = {'event': 'unknown/event', 'data': None}
+        data = encode_message(message, self.event_ids)
+        self.assertEqual(struct.unpack_from('!H', data)[0], 0)
+        self.assertEqual(decode_message(data, self.event_names), message)
+
+    def test_batch(self):
+        messages = [{'event': 'chat/new_message', 'data': i}
+            for i in range(3)]
+        data = encode_batch(
+            [encode_message(m, self.event_ids) for m in messages])
+        self.assertEqual(decode_message(data, self.event_names), messages)
+
+    def test_outbound_message(self):
+        message = OutboundMessage({'event': 'meteor/batch', 'data': [1]})
+        self.assertEqual(json.loads(message.text.decode('utf-8')),
+            message.message)
+        self.assertEqual(decode_message(message.compact(self.event_ids),
+            self.event_names), message.message)
+
+    def assertRejected(self, data, text):
+        with self.assertRaises(ProtocolError) as context:
+            decode_message(data, self.event_names)
+        self.assertIn(text, str(context.exception))
+
+    def test_event_id_out_of_table(self):
+        self.assertRejected(struct.pack('!H', 3) + encoded({}),
+            'Event id 3')
+        self.assertRejected(struct.pack('!H', 0xFFFE) + encoded({}),
+            'Event id 65534')
+
+    def test_event_id_zero_requires_name(self):
+        self.assertRejected(struct.pack('!H', 0) + encoded(5) + encoded({}),
+            'Event name')
+        self.assertRejected(struct.pack('!H', 0), 'Malformed')
+
+    def test_payload_must_be_dict(self):
+        for payload in ([1], 'text', None):
+            self.assertRejected(struct.pack('!H', 1) + encoded(payload),
+                'must be an object')
+
+    def test_rejected_inside_batch(self):
+        data = encode_batch([struct.pack('!H', 1) + encoded({}),
+            struct.pack('!H', 9) + encoded({})])
+        self.assertRejected(data, 'Event id 9')
+
+    def test_truncated_message(self):
+        data = encode_message({'event': 'chat/new_message', 'data': 'hi'},
+            self.event_ids)
+        self.assertRejected(data[:-1], 'Malformed')
+        self.assertRejected(data[:1], 'Malformed')
+
+    @unittest.skipUnless(shutil.which('node'), 'node is not installed')
+    def test_javascript_codec(self):
+        message = {'event': 'chat/new_message', 'data': {
+            'timestamp': 1760812345679, 'negative': -1760812345679,
+            'small': 5, 'int32': -70000, 'float': 1.5, 'text': 'юникод',
+            'long': 'x' * 300, 'list': [None, True, False], 'answers': {}
+        }}
+        output = subprocess.check_output(['node', '-e', NODE_SCRIPT,
+            METEOR_JS, json.dumps(self.event_names),
+            encode_message(message, self.event_ids).hex()])
+        text, data = output.decode('utf-8').splitlines()
+        self.assertEqual(json.loads(text), message)
+        decoded = decode_message(bytes.fromhex(data), self.event_names)
+        self.assertEqual(decoded, message)
+        self.assertIs(type(decoded['data']['timestamp']), int)
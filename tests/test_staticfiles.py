@@ -0,0 +1,94 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+import tornado.testing
+import tornado.web
+
+from ..exceptions import ConfigurationError
+from ..staticfiles import MemoryStaticFileHandler, create_static_handler
+
+
+class StaticHandlerTestCase(tornado.testing.AsyncHTTPTestCase):
+    options = {}
+    content = b'body { color: red; }\n' * 100
+
+    def setUp(self):
+        self.static_path = tempfile.mkdtemp(prefix='meteor-static-')
+        with open(os.path.join(self.static_path, 'app.css'), 'wb') as f:
+            f.write(self.content)
+        super(StaticHandlerTestCase, self).setUp()
+
+    def tearDown(self):
+        super(StaticHandlerTestCase, self).tearDown()
+        shutil.rmtree(self.static_path)
+
+    def get_app(self):
+        handler = create_static_handler(self.static_path, **self.options)
+        return tornado.web.Application(static_path=self.static_path,
+            static_handler_class=handler)
+
+    def get(self, headers=None):
+        return self.fetch('/static/app.css', headers=headers,
+            decompress_response=False)
+
+
+class DiskStaticHandlerTest(StaticHandlerTestCase):
+    def test_default_handler(self):
+        self.assertIs(create_static_handler(self.static_path),
+            tornado.web.StaticFileHandler)
+        self.assertEqual(self.get().body, self.content)
+
+    def test_unknown_handler(self):
+        self.assertRaises(ConfigurationError, create_static_handler,
+            self.static_path, 'cdn')
+
+
+class MemoryStaticHandlerTest(StaticHandlerTestCase):
+    options = {'handler': 'memory'}
+
+    def test_preloaded(self):
+        path = os.path.join(self.static_path, 'app.css')
+        self.assertIn(path, MemoryStaticFileHandler.files)
+        response = self.get()
+        self.assertEqual(response.body, self.content)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_gzip(self):
+        response = self.get({'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.body), self.content)
+        self.assertTrue(response.headers['Etag'].endswith('-gzip"'))
+        response = self.get({'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_range_is_served_from_identity(self):
+        response = self.get({'Accept-Encoding': 'gzip', 'Range': 'bytes=5-9'})
+        self.assertEqual(response.code, 206)
+        self.assertEqual(response.body, self.content[5:10])
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_not_modified(self):
+        for encoding in ('', 'gzip'):
+            etag = self.get({'Accept-Encoding': encoding}).headers['Etag']
+            response = self.get({'Accept-Encoding': encoding,
+                'If-None-Match': etag})
+            self.assertEqual(response.code, 304)
+
+    def test_missing_file(self):
+        with tornado.testing.ExpectLog('tornado.access', '404'):
+            response = self.fetch('/static/missing.css')
+        self.assertEqual(response.code, 404)
+
+
+class MappedStaticHandlerTest(StaticHandlerTestCase):
+    options = {'handler': 'memory', 'preload_max_size': 100}
+
+    def test_mapped_file(self):
+        path = os.path.join(self.static_path, 'app.css')
+        self.assertTrue(MemoryStaticFileHandler.files[path].mapped)
+        response = self.get({'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.body, self.content)
+        self.assertNotIn('Content-Encoding', response.headers)
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import tornado.template
+
+from ..template import loader
+from ..template.loader import CachedTemplate, PrecompiledLoader
+
+
+class PrecompiledLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='meteor-templates-')
+        self.cache_path = os.path.join(self.root, '.cache')
+        self.write('base.html', '<h1>{% block title %}base{% end %}</h1>'
+            '{% for i in items %}<i>{{ i }}</i>{% end %}')
+        self.write('page.html',
+            '{% extends "base.html" %}{% block title %}page{% end %}')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, text):
+        with open(os.path.join(self.root, name), 'w') as f:
+            f.write(text)
+
+    def render(self, name):
+        template = PrecompiledLoader(self.root, self.cache_path).load(name)
+        return template, template.generate(items=['<a>', 2])
+
+    def test_round_trip(self):
+        compiled, expected = self.render('base.html')
+        self.assertNotIsInstance(compiled, CachedTemplate)
+        self.assertEqual(len(os.listdir(self.cache_path)), 1)
+        cached, result = self.render('base.html')
+        self.assertIsInstance(cached, CachedTemplate)
+        self.assertEqual(cached.code, compiled.code)
+        self.assertEqual(result, expected)
+        self.assertEqual(result, b'<h1>base</h1><i>&lt;a&gt;</i><i>2</i>')
+
+    def test_extended_cached_template(self):
+        self.render('base.html')
+        template, result = self.render('page.html')
+        self.assertIsInstance(template.loader.load('base.html'),
+            CachedTemplate)
+        self.assertEqual(result, b'<h1>page</h1><i>&lt;a&gt;</i><i>2</i>')
+
+    def test_changed_source(self):
+        self.render('base.html')
+        self.write('base.html', '<h2>{{ len(items) }}</h2>')
+        template, result = self.render('base.html')
+        self.assertNotIsInstance(template, CachedTemplate)
+        self.assertEqual(result, b'<h2>2</h2>')
+
+    def test_without_private_api(self):
+        with mock.patch.object(loader, 'CACHE_SUPPORTED', False):
+            self.render('base.html')
+            template, result = self.render('page.html')
+        self.assertIs(type(template), tornado.template.Template)
+        self.assertFalse(os.path.exists(self.cache_path))
+        self.assertEqual(result, b'<h1>page</h1><i>&lt;a&gt;</i><i>2</i>')
@@ -0,0 +1,143 @@
+import unittest
+
+import tornado.testing
+
+from ..helpers.ratelimit import TokenBucket
+from ..helpers.timerwheel import TimerWheel
+
+
+class TimerWheelTest(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TimerWheelTest, self).setUp()
+        self.wheel = TimerWheel(tick=1.0, size=4)
+        self.fired = []
+
+    def tearDown(self):
+        self.wheel.stop()
+        super(TimerWheelTest, self).tearDown()
+
+    def advance(self, ticks):
+        for i in range(ticks):
+            self.wheel.advance()
+
+    def schedule(self, delay, name):
+        return self.wheel.schedule(delay, lambda: self.fired.append(name))
+
+    def test_fires_after_delay(self):
+        self.schedule(2, 'timer')
+        self.advance(1)
+        self.assertEqual(self.fired, [])
+        self.advance(1)
+        self.assertEqual(self.fired, ['timer'])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_wrap_around(self):
+        self.advance(3)
+        self.schedule(2, 'timer')
+        self.advance(1)
+        self.assertEqual(self.wheel.position, 0)
+        self.assertEqual(self.fired, [])
+        self.advance(1)
+        self.assertEqual(self.fired, ['timer'])
+
+    def test_rounds(self):
+        # delay longer than the wheel waits for full rotations
+        timer = self.schedule(10, 'timer')
+        self.assertEqual(timer.rounds, 2)
+        self.advance(9)
+        self.assertEqual(self.fired, [])
+        self.advance(1)
+        self.assertEqual(self.fired, ['timer'])
+
+    def test_delay_of_wheel_size(self):
+        timer = self.schedule(4, 'timer')
+        self.assertEqual(timer.rounds, 0)
+        self.advance(3)
+        self.assertEqual(self.fired, [])
+        self.advance(1)
+        self.assertEqual(self.fired, ['timer'])
+
+    def test_timers_of_the_same_slot(self):
+        self.schedule(1, 'near')
+        self.schedule(5, 'far')
+        self.advance(1)
+        self.assertEqual(self.fired, ['near'])
+        self.advance(4)
+        self.assertEqual(self.fired, ['near', 'far'])
+
+    def test_cancel(self):
+        timer = self.schedule(2, 'timer')
+        timer.cancel()
+        timer.cancel()
+        self.advance(8)
+        self.assertEqual(self.fired, [])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_short_delay_takes_one_tick(self):
+        self.schedule(0.1, 'timer')
+        self.advance(1)
+        self.assertEqual(self.fired, ['timer'])
+
+    def test_failing_callback(self):
+        def fail():
+            raise ValueError('timer')
+        self.wheel.schedule(1, fail)
+        self.schedule(1, 'timer')
+        with self.assertLogs(level='ERROR'):
+            self.advance(1)
+        self.assertEqual(self.fired, ['timer'])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_callback_reschedules(self):
+        def reschedule():
+            self.fired.append('first')
+            self.schedule(4, 'second')
+        self.wheel.schedule(4, reschedule)
+        self.advance(4)
+        self.assertEqual(self.fired, ['first'])
+        self.assertEqual(len(self.wheel), 1)
+        self.advance(3)
+        self.assertEqual(self.fired, ['first'])
+        self.advance(1)
+        self.assertEqual(self.fired, ['first', 'second'])
+
+    def test_callback_cancels_expired_timer(self):
+        timers = []
+        def cancel_others():
+            self.fired.append('canceller')
+            for timer in timers:
+                timer.cancel()
+        timers.append(self.schedule(1, 'first'))
+        timers.append(self.wheel.schedule(1, cancel_others))
+        timers.append(self.schedule(1, 'second'))
+        self.advance(1)
+        # timers of the slot run in any order, those after canceller don't
+        self.assertEqual(self.fired[-1], 'canceller')
+
+
+class TokenBucketTest(unittest.TestCase):
+    def elapse(self, bucket, seconds):
+        bucket.updated -= seconds
+
+    def test_burst(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        self.assertEqual([bucket.consume() for i in range(4)],
+            [True, True, True, False])
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=2, burst=2)
+        self.assertTrue(bucket.consume(2))
+        self.assertFalse(bucket.consume())
+        self.elapse(bucket, 0.5)
+        self.assertTrue(bucket.consume())
+        self.assertFalse(bucket.consume())
+
+    def test_refill_is_capped_by_burst(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.elapse(bucket, 60)
+        self.assertTrue(bucket.consume(2))
+        self.assertFalse(bucket.consume())
+
+    def test_burst_defaults_to_rate(self):
+        bucket = TokenBucket(rate=5)
+        self.assertEqual(bucket.burst, 5)
@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+
+import tornado.gen
+import tornado.testing
+import tornado.web
+
+from ..client import StaticManager
+from ..handlers import View
+
+
+class Page(View):
+    package = 'tests'
+
+    def get(self):
+        # views of the repo call "render_view" without returning its result
+        self.render_view('page.html', text=self.get_argument('text', 'a'))
+
+    def metadata(self):
+        return {'title': 'Page'}
+
+
+class StreamedPage(Page):
+    streaming = True
+
+    @tornado.gen.coroutine
+    def slow_text(self):
+        yield tornado.gen.sleep(0.05)
+        if self.get_argument('fail', None):
+            raise ValueError('Failed text')
+        return 'late'
+
+    def get(self):
+        self.render_view('page.html', text=self.slow_text())
+
+
+class ReturnedStreamedPage(StreamedPage):
+    def get(self):
+        return self.render_view('page.html', text=self.slow_text())
+
+
+class ViewTest(tornado.testing.AsyncHTTPTestCase):
+    def setUp(self):
+        self.static_path = tempfile.mkdtemp(prefix='meteor-view-')
+        View.wrapper_cache.clear()
+        super(ViewTest, self).setUp()
+
+    def tearDown(self):
+        super(ViewTest, self).tearDown()
+        shutil.rmtree(self.static_path)
+
+    def get_app(self):
+        app = tornado.web.Application([
+            ('/', Page), ('/streamed', StreamedPage),
+            ('/returned', ReturnedStreamedPage)
+        ], static_path=self.static_path, use_compressed_static=False)
+        app.views_metadata = {
+            'meta': [{'charset': 'utf-8'}], 'doctype': '<!doctype html>',
+            'title': None, 'favicon': None
+        }
+        app.static_manager = StaticManager(self.static_path, {}, [])
+        return app
+
+    def assertPage(self, body, text):
+        self.assertIn(b'<title>Page</title>', body)
+        self.assertIn('<p>{0}</p>'.format(text).encode('utf-8'), body)
+        self.assertTrue(body.rstrip().endswith(b'</html>'))
+
+    def test_page(self):
+        self.assertPage(self.fetch('/?text=one').body, 'one')
+        self.assertPage(self.fetch('/?text=two').body, 'two')
+        self.assertEqual(len(View.wrapper_cache), 1)
+
+    def test_streamed_page_without_returned_result(self):
+        response = self.fetch('/streamed')
+        self.assertEqual(response.code, 200)
+        self.assertPage(response.body, 'late')
+
+    def test_streamed_page_with_returned_result(self):
+        self.assertPage(self.fetch('/returned').body, 'late')
+
+    def test_streamed_head_is_flushed_first(self):
+        chunks = []
+        self.fetch('/streamed', streaming_callback=chunks.append)
+        self.assertGreater(len(chunks), 1)
+        self.assertNotIn(b'<p>', chunks[0])
+        self.assertPage(b''.join(chunks), 'late')
+
+    def test_streamed_page_error(self):
+        for url in ('/streamed?fail=1', '/returned?fail=1'):
+            with tornado.testing.ExpectLog('tornado.application',
+                    'Uncaught exception'):
+                response = self.fetch(url)
+            self.assertEqual(response.code, 200)
+            self.assertIn(b'<title>Page</title>', response.body)
+            self.assertNotIn(b'</html>', response.body)
@@ -64,10 +64,59 @@ colored_output = True
 change_builtins = True
 default_locale = en
 use_compressed_static = False
+build_static = False
 
 [server]
 host = localhost
 port = 8888
+processes = 1
+
+[websocket]
+coalesce = False
+coalesce_delay = 0
+max_buffer_size = 1048576
+slow_consumer_policy = drop_oldest
+compact_protocol = False
+compression = False
+compression_min_size = 1024
+compression_level = 6
+compression_mem_level = 8
+compression_context_takeover = False
+presence_events = False
+rate_limit = 0
+rate_burst = 0
+max_channels = 64
+max_channel_length = 128
+heartbeat_interval = 30
+heartbeat_tick = 1.0
+idle_timeout = 90
+stats_url =
+
+[stream]
+enabled = True
+poll_timeout = 25
+session_timeout = 60
+keepalive_interval = 15
+max_buffer_size = 1048576
+rate_limit = 0
+rate_burst = 0
+max_channels = 64
+max_channel_length = 128
+
+[bus]
+backend = local
+
+[templates]
+precompile = True
+cache_path =
+
+[static]
+handler = disk
+preload = True
+preload_max_size = 262144
+gzip = True
+gzip_min_size = 512
+gzip_level = 9
 
 [database:db]
 host = 127.0.0.1
@@ -75,6 +124,7 @@ port = 27017
 db_name = test
 gen_ids = True
 safe_mode = False
+max_workers = 4
 
 [settings]
 cookie_secret = {0}
@@ -132,6 +182,7 @@ def create_package(app_path, package_name):
             'from meteor.odm import fields\n',
         #'forms': 'from meteor.odm.core import Form\n',
         'handlers': 'from meteor.handlers import EventHandler\n',
+        'filters': 'from meteor.template.filters import TemplateFilter\n',
     }
 
     for k, v in files.items():
@@ -152,6 +203,10 @@ def parse_args(func):
     def wrapper():
         if len(sys.argv) == 3 and sys.argv[1] == '--new-package':
             create_package(sys.path[0], sys.argv[2])
+        elif len(sys.argv) == 2 and sys.argv[1] == '--build-static':
+            from .core import Application
+            Application.build_only = True
+            return func()
         else:
             return func()
     return wrapper